@@ -0,0 +1,248 @@
+"""
+Rollups pre-agregados de puntuaciones por minuto, hora y día.
+
+Cada puntuación guardada incrementa un documento por granularidad y nivel en
+la colección `score_rollups`. Los endpoints de analítica leen solo estos
+documentos, así que su coste depende del rango de tiempo consultado y no del
+número de puntuaciones almacenadas.
+
+Para recalcular los rollups de días anteriores a partir de `scores` y del
+archivo en disco (los del día en curso no se tocan y siguen llegando desde
+`record_score`):
+
+    python analytics.py backfill
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from pymongo import ASCENDING, ReplaceOne, UpdateOne
+from models import SCORE_FIELDS
+import archive
+import score_store
+
+ROLLUPS_COLLECTION = "score_rollups"
+
+GRANULARITIES = ("minute", "hour", "day")
+
+# Rango por defecto de cada granularidad cuando no se indica `since`
+DEFAULT_WINDOWS = {
+    "minute": timedelta(hours=1),
+    "hour": timedelta(days=1),
+    "day": timedelta(days=30),
+}
+
+# Los rollups por minuto solo se conservan un tiempo limitado (índice TTL)
+MINUTE_RETENTION = timedelta(days=2)
+
+# Margen ante puntuaciones cuyo timestamp se asignó antes de empezar el backfill
+# pero que se guardaron después
+BACKFILL_MARGIN = timedelta(minutes=5)
+
+# Límites inferiores (en segundos) de los rangos de duración de partida
+SESSION_BUCKETS = [0, 30, 60, 120, 300, 600, 1800]
+
+
+def truncate(timestamp: datetime, granularity: str) -> datetime:
+    """Redondear un timestamp hacia abajo al inicio de su bucket"""
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Granularidad no válida: {granularity}")
+
+
+def session_bucket(time_played: int) -> int:
+    """Límite inferior del rango de duración al que pertenece una partida"""
+    lower = SESSION_BUCKETS[0]
+    for bound in SESSION_BUCKETS:
+        if time_played < bound:
+            break
+        lower = bound
+    return lower
+
+
+def rollup_id(granularity: str, level: int, bucket: datetime) -> str:
+    return f"{granularity}:{level}:{bucket.isoformat()}"
+
+
+def rollup_updates(score: dict, games: int = 1, score_sum: Optional[int] = None,
+                   time_sum: Optional[int] = None, sessions: Optional[Dict[int, int]] = None,
+                   max_score: Optional[int] = None) -> List[UpdateOne]:
+    """
+    Operaciones de upsert que incorporan una puntuación (o un lote ya
+    agregado de puntuaciones del mismo nivel y bucket) a los rollups.
+    """
+    if score_sum is None:
+        score_sum = score["score"]
+    if time_sum is None:
+        time_sum = score["time_played"]
+    if sessions is None:
+        sessions = {session_bucket(score["time_played"]): 1}
+    if max_score is None:
+        max_score = score["score"]
+
+    increments = {"games": games, "score_sum": score_sum, "time_sum": time_sum}
+    for lower, count in sessions.items():
+        increments[f"sessions.{lower}"] = count
+
+    operations = []
+    for granularity in GRANULARITIES:
+        bucket = truncate(score["timestamp"], granularity)
+        on_insert = {"granularity": granularity, "level": score["level"], "bucket": bucket}
+        if granularity == "minute":
+            on_insert["expires_at"] = bucket + MINUTE_RETENTION
+        operations.append(UpdateOne(
+            {"_id": rollup_id(granularity, score["level"], bucket)},
+            {"$inc": increments, "$max": {"max_score": max_score}, "$setOnInsert": on_insert},
+            upsert=True
+        ))
+    return operations
+
+
+async def ensure_rollup_indexes(database):
+    """Crear los índices que usan las consultas de analítica"""
+    rollups = database[ROLLUPS_COLLECTION]
+    await rollups.create_index([("granularity", ASCENDING), ("bucket", ASCENDING), ("level", ASCENDING)])
+    await rollups.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def record_score(database, score: dict):
+    """Incorporar una puntuación recién guardada a los rollups"""
+    await database[ROLLUPS_COLLECTION].bulk_write(rollup_updates(score), ordered=False)
+
+
+def _group_score(groups: Dict[tuple, dict], score: dict, minute_cutoff: datetime):
+    """
+    Acumular una puntuación en sus buckets por hora y día, y por minuto solo
+    si ese rollup sigue dentro de la retención (así la memoria no crece con
+    los minutos de todo el histórico)
+    """
+    lower = session_bucket(score["time_played"])
+    for granularity in GRANULARITIES:
+        bucket = truncate(score["timestamp"], granularity)
+        if granularity == "minute" and bucket < minute_cutoff:
+            continue
+        key = (granularity, score["level"], bucket)
+        group = groups.setdefault(key, {"games": 0, "score_sum": 0, "time_sum": 0, "max_score": score["score"], "sessions": {}})
+        group["games"] += 1
+        group["score_sum"] += score["score"]
+        group["time_sum"] += score["time_played"]
+        group["max_score"] = max(group["max_score"], score["score"])
+        group["sessions"][str(lower)] = group["sessions"].get(str(lower), 0) + 1
+
+
+def _rollup_document(key: tuple, group: dict, backfilled_at: datetime) -> dict:
+    """Documento completo de un rollup recalculado (valores absolutos)"""
+    granularity, level, bucket = key
+    document = {
+        "_id": rollup_id(granularity, level, bucket),
+        "granularity": granularity,
+        "level": level,
+        "bucket": bucket,
+        "backfilled_at": backfilled_at,
+        **group,
+    }
+    if granularity == "minute":
+        document["expires_at"] = bucket + MINUTE_RETENTION
+    return document
+
+
+async def backfill_rollups(database, batch_size: int = 1000) -> int:
+    """
+    Recalcular los rollups de días ya cerrados a partir de la colección `scores`
+    y de las particiones archivadas en disco.
+
+    Solo se reconstruyen los buckets anteriores al inicio del día en curso
+    (menos `BACKFILL_MARGIN`): las puntuaciones que se guardan mientras dura el
+    backfill caen en buckets posteriores, que `record_score` sigue actualizando
+    y que aquí no se tocan. Así no se pierde ninguna puntuación concurrente.
+
+    Cada rollup se reemplaza con sus valores absolutos y solo al final se
+    borran los que no se reescribieron (buckets que ya no tienen partidas), de
+    modo que las consultas nunca ven el histórico vacío y un fallo a mitad deja
+    los rollups antiguos en su sitio. No debe ejecutarse a la vez que
+    `archive.py`, que mueve puntuaciones de `scores` al archivo.
+    """
+    started = datetime.utcnow()
+    cutoff = truncate(started - BACKFILL_MARGIN, "day")
+    minute_cutoff = truncate(started, "minute") - MINUTE_RETENTION
+    groups: Dict[tuple, dict] = {}
+    processed = 0
+
+    fields = ["score", "level", "time_played", "timestamp"]
+    projection = {"_id": 0, **score_store.fields_projection(fields)}
+    # Los documentos aún sin migrar usan los nombres de campo completos
+    query = {"$or": [{SCORE_FIELDS["timestamp"]: {"$lt": cutoff}}, {"timestamp": {"$lt": cutoff}}]}
+    async for document in database.scores.find(query, projection).batch_size(batch_size):
+        _group_score(groups, {field: score_store.read_field(document, field) for field in fields}, minute_cutoff)
+        processed += 1
+
+    # Las puntuaciones movidas a disco por archive.py también forman parte del histórico
+    async for frame in archive.iter_archived_frames(database, until=cutoff, columns=fields):
+        for row in frame.itertuples(index=False):
+            _group_score(groups, {
+                "score": int(row.score),
+                "level": int(row.level),
+                "time_played": int(row.time_played),
+                "timestamp": row.timestamp.to_pydatetime(),
+            }, minute_cutoff)
+        processed += len(frame)
+
+    rollups = database[ROLLUPS_COLLECTION]
+    operations = []
+    for key, group in groups.items():
+        document = _rollup_document(key, group, started)
+        operations.append(ReplaceOne({"_id": document["_id"]}, document, upsert=True))
+        if len(operations) >= batch_size:
+            await rollups.bulk_write(operations, ordered=False)
+            operations = []
+
+    if operations:
+        await rollups.bulk_write(operations, ordered=False)
+
+    # El corte está alineado al día, así que cada bucket queda entero a un lado
+    await rollups.delete_many({"bucket": {"$lt": cutoff}, "backfilled_at": {"$ne": started}})
+    return processed
+
+
+async def query_rollups(database, granularity: str, since: Optional[datetime] = None,
+                        until: Optional[datetime] = None, level: Optional[int] = None) -> List[dict]:
+    """Leer los rollups de una granularidad dentro de un rango de tiempo"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularidad no válida: {granularity}")
+
+    until = until or datetime.utcnow()
+    since = since or until - DEFAULT_WINDOWS[granularity]
+
+    filter_dict = {"granularity": granularity, "bucket": {"$gte": truncate(since, granularity), "$lte": until}}
+    if level is not None:
+        filter_dict["level"] = level
+
+    return await database[ROLLUPS_COLLECTION].find(filter_dict).sort("bucket", ASCENDING).to_list(None)
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    import sys
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    if sys.argv[1:] != ["backfill"]:
+        print("Uso: python analytics.py backfill")
+        sys.exit(1)
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        database = client[os.environ['DB_NAME']]
+        await ensure_rollup_indexes(database)
+        processed = await backfill_rollups(database)
+        print(f"Rollups recalculados a partir de {processed} puntuaciones")
+        client.close()
+
+    asyncio.run(main())
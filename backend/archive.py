@@ -0,0 +1,251 @@
+"""
+Archivo en frío de puntuaciones antiguas.
+
+Las puntuaciones con más de `SCORE_ARCHIVE_MAX_AGE_DAYS` días se mueven de la
+colección `scores` a ficheros Parquet comprimidos en disco, particionados por
+día (`<SCORE_ARCHIVE_DIR>/day=YYYY-MM-DD/part-<hash>.parquet`). Por cada
+fichero se guarda en `score_archive_partitions` un resumen por nivel y las
+mejores puntuaciones, y se incorpora a un único resumen global en
+`score_archive_summary`. `/api/stats` y el leaderboard leen solo ese
+documento, así que su coste no crece con la antigüedad del archivo. El leaderboard solo puede
+combinar las `TOP_SCORES_PER_PARTITION` mejores de cada partición, así que
+su tamaño máximo es ese mismo valor.
+
+Para archivar:
+
+    python archive.py
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+import pandas as pd
+from bson import ObjectId
+from pymongo import ASCENDING
+from models import SCORE_FIELDS
+import score_store
+
+PARTITIONS_COLLECTION = "score_archive_partitions"
+
+# Un único documento con los totales por nivel y las mejores puntuaciones de
+# todo el archivo, que leen `/api/stats` y el leaderboard
+SUMMARY_COLLECTION = "score_archive_summary"
+SUMMARY_DOCUMENT_ID = "totals"
+
+DEFAULT_ARCHIVE_DIR = Path(__file__).parent / "archive" / "scores"
+DEFAULT_MAX_AGE_DAYS = 30
+
+# Mejores puntuaciones de cada partición que se conservan en MongoDB
+TOP_SCORES_PER_PARTITION = 100
+
+ARCHIVE_COLUMNS = ["id", "player_name", "score", "level", "lives_remaining", "time_played", "timestamp"]
+
+
+def archive_dir() -> Path:
+    """Directorio raíz del archivo (variable de entorno SCORE_ARCHIVE_DIR)"""
+    return Path(os.environ.get("SCORE_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR))
+
+
+def partition_dir(day: datetime) -> Path:
+    return archive_dir() / f"day={day:%Y-%m-%d}"
+
+
+async def ensure_archive_indexes(database):
+    """Crear los índices que usan el archivado y la lectura de particiones"""
+    await database.scores.create_index(SCORE_FIELDS["timestamp"])
+    await database[PARTITIONS_COLLECTION].create_index("day")
+
+
+def summarize(frame: pd.DataFrame) -> dict:
+    """Resumen por nivel y mejores puntuaciones de un bloque archivado"""
+    per_level = frame.groupby("level")["score"].agg(["count", "sum", "max"])
+    top = frame.nlargest(TOP_SCORES_PER_PARTITION, "score")
+    return {
+        "games": int(len(frame)),
+        "levels": [
+            {"level": int(level), "games": int(row["count"]), "score_sum": int(row["sum"]), "max_score": int(row["max"])}
+            for level, row in per_level.iterrows()
+        ],
+        "top_scores": [
+            {"player_name": row.player_name, "score": int(row.score), "level": int(row.level), "timestamp": row.timestamp.to_pydatetime()}
+            for row in top.itertuples()
+        ],
+    }
+
+
+async def archive_day(database, day: datetime, cutoff: datetime) -> int:
+    """Archivar las puntuaciones de un día anteriores a `cutoff`"""
+    query = {SCORE_FIELDS["timestamp"]: {"$gte": day, "$lt": min(day + timedelta(days=1), cutoff)}}
+    documents = await database.scores.find(query).to_list(None)
+    if not documents:
+        return 0
+
+    # En disco se guardan los nombres completos de campos y jugadores
+    scores = await score_store.to_scores(database, documents)
+    frame = pd.DataFrame([score.dict() for score in scores], columns=ARCHIVE_COLUMNS).sort_values("timestamp", kind="stable")
+
+    # Nombre determinista: si el proceso se interrumpe antes de borrar, volver
+    # a ejecutarlo sobrescribe el mismo fichero y el mismo resumen
+    digest = hashlib.sha1("".join(sorted(frame["id"])).encode()).hexdigest()[:16]
+    directory = partition_dir(day)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"part-{digest}.parquet"
+    tmp_path = path.with_suffix(".tmp")
+    frame.to_parquet(tmp_path, compression="zstd", index=False)
+    os.replace(tmp_path, path)
+
+    partition = {"day": day, "path": str(path.relative_to(archive_dir())), "archived_at": datetime.utcnow()}
+    partition.update(summarize(frame))
+    await database[PARTITIONS_COLLECTION].replace_one({"_id": partition["path"]}, partition, upsert=True)
+    await update_summary(database, partition)
+
+    await database.scores.delete_many({"_id": {"$in": [ObjectId(score_id) for score_id in frame["id"]]}})
+    return len(frame)
+
+
+async def archive_old_scores(database, max_age_days: Optional[int] = None) -> int:
+    """
+    Mover a disco todas las puntuaciones más antiguas que `max_age_days`
+    (por defecto, la variable de entorno SCORE_ARCHIVE_MAX_AGE_DAYS)
+    """
+    if max_age_days is None:
+        max_age_days = int(os.environ.get("SCORE_ARCHIVE_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS))
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    archived = 0
+    while True:
+        timestamp_field = SCORE_FIELDS["timestamp"]
+        oldest = await database.scores.find_one(
+            {timestamp_field: {"$lt": cutoff}}, {timestamp_field: 1}, sort=[(timestamp_field, ASCENDING)]
+        )
+        if not oldest:
+            return archived
+        day = oldest[timestamp_field].replace(hour=0, minute=0, second=0, microsecond=0)
+        archived += await archive_day(database, day, cutoff)
+
+
+def merge_summary(current: Optional[dict], partition: dict) -> dict:
+    """Añadir el resumen de una partición al resumen global del archivo"""
+    levels = {entry["level"]: dict(entry) for entry in (current or {}).get("levels", [])}
+    for entry in partition["levels"]:
+        totals = levels.setdefault(entry["level"], {"level": entry["level"], "games": 0, "score_sum": 0, "max_score": entry["max_score"]})
+        totals["games"] += entry["games"]
+        totals["score_sum"] += entry["score_sum"]
+        totals["max_score"] = max(totals["max_score"], entry["max_score"])
+
+    top_scores = (current or {}).get("top_scores", []) + partition["top_scores"]
+    top_scores.sort(key=lambda score: score["score"], reverse=True)
+    return {
+        "_id": SUMMARY_DOCUMENT_ID,
+        "levels": sorted(levels.values(), key=lambda totals: totals["level"]),
+        "top_scores": top_scores[:TOP_SCORES_PER_PARTITION],
+        "last_partition": partition["path"],
+    }
+
+
+async def update_summary(database, partition: dict):
+    """
+    Incorporar una partición al resumen global. Si el proceso se interrumpió
+    después de hacerlo y antes de borrar las puntuaciones, al repetir el día
+    se genera la misma partición y no se vuelve a sumar.
+    """
+    summaries = database[SUMMARY_COLLECTION]
+    current = await summaries.find_one({"_id": SUMMARY_DOCUMENT_ID})
+    if current and current.get("last_partition") == partition["path"]:
+        return
+    await summaries.replace_one({"_id": SUMMARY_DOCUMENT_ID}, merge_summary(current, partition), upsert=True)
+
+
+async def ensure_archive_summary(database):
+    """Construir el resumen global a partir de las particiones si todavía no existe"""
+    if await database[SUMMARY_COLLECTION].find_one({"_id": SUMMARY_DOCUMENT_ID}, {"_id": 1}):
+        return
+    summary = None
+    async for partition in database[PARTITIONS_COLLECTION].find().sort("day", ASCENDING):
+        summary = merge_summary(summary, partition)
+    if summary:
+        await database[SUMMARY_COLLECTION].replace_one({"_id": SUMMARY_DOCUMENT_ID}, summary, upsert=True)
+
+
+async def archived_level_totals(database) -> List[dict]:
+    """Partidas, suma y máximo de puntuación por nivel de todo el archivo"""
+    summary = await database[SUMMARY_COLLECTION].find_one({"_id": SUMMARY_DOCUMENT_ID}, {"levels": 1})
+    return [{"_id": totals["level"], **totals} for totals in (summary or {}).get("levels", [])]
+
+
+async def archived_top_scores(database, limit: int) -> List[dict]:
+    """Mejores puntuaciones archivadas (del resumen global del archivo)"""
+    summary = await database[SUMMARY_COLLECTION].find_one({"_id": SUMMARY_DOCUMENT_ID}, {"top_scores": 1})
+    return (summary or {}).get("top_scores", [])[:limit]
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Las marcas de tiempo del archivo son UTC sin zona horaria"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def iter_archived_frames(database, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                               columns: Optional[List[str]] = None,
+                               ids: Optional[List[str]] = None) -> AsyncIterator[pd.DataFrame]:
+    """
+    Recorrer el archivo partición a partición (en orden cronológico), de modo
+    que nunca se carga más de un fichero en memoria. El filtrado por rango y
+    por id se delega en pyarrow.
+    """
+    query = {}
+    filters = []
+    if since is not None:
+        since = naive_utc(since)
+        query.setdefault("day", {})["$gte"] = since.replace(hour=0, minute=0, second=0, microsecond=0)
+        filters.append(("timestamp", ">=", since))
+    if until is not None:
+        until = naive_utc(until)
+        query.setdefault("day", {})["$lt"] = until
+        filters.append(("timestamp", "<", until))
+    if ids is not None:
+        filters.append(("id", "in", ids))
+
+    read_columns = columns or ARCHIVE_COLUMNS
+    async for partition in database[PARTITIONS_COLLECTION].find(query, {"path": 1}).sort("day", ASCENDING):
+        frame = pd.read_parquet(archive_dir() / partition["path"], columns=read_columns, filters=filters or None)
+        if len(frame):
+            yield frame
+
+
+async def read_archived_scores(database, since: datetime, until: datetime, limit: int,
+                               columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Leer del disco las primeras `limit` puntuaciones archivadas entre `since` y `until`"""
+    frames = []
+    read = 0
+    async for frame in iter_archived_frames(database, since, until, columns):
+        frames.append(frame)
+        read += len(frame)
+        # Las particiones llegan en orden: no hace falta abrir las siguientes
+        if read >= limit:
+            break
+
+    if not frames:
+        return pd.DataFrame(columns=columns or ARCHIVE_COLUMNS)
+    return pd.concat(frames, ignore_index=True).head(limit)
+
+
+if __name__ == "__main__":
+    import asyncio
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        database = client[os.environ['DB_NAME']]
+        await ensure_archive_indexes(database)
+        await ensure_archive_summary(database)
+        archived = await archive_old_scores(database)
+        print(f"{archived} puntuaciones archivadas en {archive_dir()}")
+        client.close()
+
+    asyncio.run(main())
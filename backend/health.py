@@ -0,0 +1,103 @@
+"""
+Endpoints de liveness y readiness y precalentamiento del worker.
+
+`/api/health/live` solo indica que el proceso responde. `/api/health/ready`
+responde 503 hasta que el precalentamiento termina (ping a MongoDB, índices,
+índice de búsqueda de demos y leaderboard) y después sigue comprobando que
+MongoDB sea accesible.
+"""
+
+import asyncio
+import logging
+import time
+from fastapi import APIRouter, HTTPException
+import analytics
+import archive
+import idempotency
+import recent_scores
+import routes
+import score_store
+import telemetry
+from models import SCORE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+PING_TIMEOUT = 2.0
+RETRY_DELAY = 5.0
+
+# Entradas del leaderboard que se precargan (incluye los nombres de jugador)
+WARM_LEADERBOARD_SIZE = 100
+
+warm_up_state = {"ready": False, "timings": {}, "error": None}
+
+
+async def ping(database):
+    await asyncio.wait_for(database.command("ping"), timeout=PING_TIMEOUT)
+
+
+async def warm_leaderboard(database):
+    """Paginar en memoria el índice de puntuaciones y la caché de jugadores"""
+    documents = await database.scores.find().sort(SCORE_FIELDS["score"], -1).limit(WARM_LEADERBOARD_SIZE).to_list(WARM_LEADERBOARD_SIZE)
+    await score_store.to_scores(database, documents)
+    await archive.archived_top_scores(database, WARM_LEADERBOARD_SIZE)
+
+
+async def warm_up_once(database):
+    """Ejecutar cada paso del precalentamiento registrando su duración"""
+    steps = [
+        ("ping", ping),
+        ("telemetry_collection", telemetry.ensure_telemetry_collection),
+        ("rollup_indexes", analytics.ensure_rollup_indexes),
+        ("archive_indexes", archive.ensure_archive_indexes),
+        ("archive_summary", archive.ensure_archive_summary),
+        ("score_indexes", score_store.ensure_score_indexes),
+        ("score_schema", score_store.ensure_score_schema),
+        ("idempotency_indexes", idempotency.ensure_idempotency_indexes),
+        ("demo_search_index", routes.build_search_index),
+        ("leaderboard", warm_leaderboard),
+        ("recent_scores", recent_scores.preload),
+    ]
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        await step(database)
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"Paso de precalentamiento '{name}' completado en {timings[name]} ms")
+    return timings
+
+
+async def warm_up(database):
+    """Precalentar el worker, reintentando hasta que MongoDB esté disponible"""
+    while True:
+        try:
+            warm_up_state["timings"] = await warm_up_once(database)
+            warm_up_state["error"] = None
+            warm_up_state["ready"] = True
+            logger.info(f"Worker listo tras el precalentamiento ({sum(warm_up_state['timings'].values()):.2f} ms)")
+            return
+        except Exception as e:
+            warm_up_state["error"] = str(e)
+            logger.warning(f"Falló el precalentamiento, reintentando en {RETRY_DELAY}s: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+
+
+@router.get("/health/live")
+async def liveness():
+    """El proceso está vivo (no consulta dependencias)"""
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+async def readiness():
+    """El worker está precalentado y MongoDB responde"""
+    if not warm_up_state["ready"]:
+        raise HTTPException(status_code=503, detail={"status": "warming_up", "error": warm_up_state["error"]})
+
+    try:
+        await ping(routes.get_database())
+    except Exception as e:
+        raise HTTPException(status_code=503, detail={"status": "database_unreachable", "error": str(e) or type(e).__name__})
+
+    return {"status": "ready", "warm_up_ms": warm_up_state["timings"]}
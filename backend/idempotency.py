@@ -0,0 +1,127 @@
+"""
+Claves de idempotencia para `POST /api/scores`.
+
+Un cliente que reintenta una puntuación con la misma cabecera
+`Idempotency-Key` recibe la Score original sin que se escriba otra. Las
+claves se buscan primero en una caché LRU en memoria y después en la
+colección `idempotency_keys`, cuyos documentos expiran por TTL.
+
+Cada clave se registra como pendiente antes de guardar la Score y se confirma
+después. Un reintento solo responde con la Score original sin escribirla si
+la clave está confirmada; si sigue pendiente, vuelve a guardar la misma Score
+(mismo `_id`), de modo que nunca se responde 200 por una puntuación que no
+llegó a MongoDB.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Tuple
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from models import Score, ScoreCreate
+
+KEYS_COLLECTION = "idempotency_keys"
+
+# Longitud máxima de la cabecera (la clave se usa como `_id` en MongoDB)
+MAX_KEY_LENGTH = 255
+
+# Tiempo durante el que una clave sigue siendo válida para reintentos
+KEY_TTL = timedelta(hours=24)
+
+# Número máximo de claves recientes en la caché en memoria
+CACHE_SIZE = 10000
+
+# Estados de una clave: registrada antes de guardar la Score, y confirmada después
+PENDING = "pending"
+COMMITTED = "committed"
+
+# Solo se guardan en caché claves confirmadas
+_cache: "OrderedDict[str, dict]" = OrderedDict()
+
+
+class IdempotencyConflict(Exception):
+    """La clave ya se usó con una puntuación distinta"""
+
+
+def request_hash(score_data: ScoreCreate) -> str:
+    payload = json.dumps(score_data.dict(), sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _remember(key: str, entry: dict):
+    _cache[key] = entry
+    _cache.move_to_end(key)
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _expired(entry: dict, now: datetime) -> bool:
+    return entry["created_at"] + KEY_TTL <= now
+
+
+def _resolve(entry: dict, expected_hash: str) -> Score:
+    if entry["request_hash"] != expected_hash:
+        raise IdempotencyConflict()
+    return Score(**entry["score"])
+
+
+async def ensure_idempotency_indexes(database):
+    """Índice TTL que elimina las claves caducadas"""
+    await database[KEYS_COLLECTION].create_index("created_at", expireAfterSeconds=int(KEY_TTL.total_seconds()))
+
+
+async def begin(database, key: str, score_data: ScoreCreate, score: Score) -> Tuple[Score, bool]:
+    """
+    Registrar la clave para una nueva Score, o recuperar la ya registrada.
+
+    Retorna la Score asociada a la clave y si ya consta como guardada. Si la
+    clave sigue pendiente (otra petición la registró y aún no confirmó el
+    guardado, o su worker murió antes), el llamador debe guardar esa misma
+    Score: su `_id` es fijo, así que como mucho se escribe una vez.
+    """
+    expected_hash = request_hash(score_data)
+    now = datetime.utcnow()
+    entry = _cache.get(key)
+    if entry is not None:
+        if not _expired(entry, now):
+            return _resolve(entry, expected_hash), True
+        del _cache[key]
+
+    keys = database[KEYS_COLLECTION]
+    entry = {
+        "_id": key,
+        "request_hash": expected_hash,
+        "score": score.dict(),
+        "state": PENDING,
+        "created_at": now,
+    }
+    while True:
+        try:
+            await keys.insert_one(entry)
+            return score, False
+        except DuplicateKeyError:
+            pass
+
+        # El índice TTL tarda hasta un minuto en borrar las claves caducadas
+        if await keys.find_one_and_replace({"_id": key, "created_at": {"$lte": now - KEY_TTL}}, entry):
+            return score, False
+
+        existing = await keys.find_one({"_id": key})
+        if existing is None:
+            continue  # Caducó entre las dos consultas: volver a registrarla
+        previous = _resolve(existing, expected_hash)
+        committed = existing.get("state") == COMMITTED
+        if committed:
+            _remember(key, existing)
+        return previous, committed
+
+
+async def commit(database, key: str):
+    """Marcar como guardada la Score asociada a la clave"""
+    entry = await database[KEYS_COLLECTION].find_one_and_update(
+        {"_id": key}, {"$set": {"state": COMMITTED}}, return_document=ReturnDocument.AFTER
+    )
+    if entry is not None:
+        _remember(key, entry)
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, List, Optional
 from datetime import datetime
+from bson import ObjectId
 import uuid
 
 class Demo(BaseModel):
@@ -24,8 +25,34 @@ class DemoCreate(BaseModel):
     preview: str
     scene_name: str
 
+class DemoSummary(BaseModel):
+    """Representación ligera de una demo para vistas de lista (sin código)"""
+    id: str
+    title: str
+    level: str
+    difficulty: str
+    preview: str
+    scene_name: str
+
+class DemoProjection(BaseModel):
+    """Demo con solo los campos solicitados mediante `fields=`"""
+    id: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    level: Optional[str] = None
+    code_example: Optional[str] = None
+    technologies: Optional[List[str]] = None
+    difficulty: Optional[str] = None
+    preview: Optional[str] = None
+    scene_name: Optional[str] = None
+
+class DemoSearchResult(BaseModel):
+    total: int
+    results: List[Demo]
+    facets: Dict[str, int]  # tecnología -> número de demos que coinciden
+
 class Score(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: str(ObjectId()))  # Es el _id del documento en MongoDB
     player_name: str
     score: int
     level: int
@@ -33,6 +60,20 @@ class Score(BaseModel):
     time_played: int  # en segundos
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class ScoreDocument(BaseModel):
+    """Documento compacto de la colección `scores` (nombres cortos vía alias)"""
+    model_config = ConfigDict(populate_by_name=True)
+
+    player_id: int = Field(alias="p")  # _id en la colección `players`
+    score: int = Field(alias="s")
+    level: int = Field(alias="l")
+    lives_remaining: int = Field(alias="lr")
+    time_played: int = Field(alias="t")
+    timestamp: datetime = Field(alias="ts")
+
+# Nombre de cada campo de Score tal como se guarda en MongoDB
+SCORE_FIELDS = {name: field.alias for name, field in ScoreDocument.model_fields.items()}
+
 class ScoreCreate(BaseModel):
     player_name: str
     score: int
@@ -40,6 +81,10 @@ class ScoreCreate(BaseModel):
     lives_remaining: int
     time_played: int
 
+class RecentScores(BaseModel):
+    cursor: Optional[str] = None  # Enviar como `since` en la siguiente consulta
+    scores: List[Score]  # De la más reciente a la más antigua
+
 class LeaderboardEntry(BaseModel):
     rank: int
     player_name: str
@@ -51,4 +96,43 @@ class GameStats(BaseModel):
     total_games: int
     average_score: float
     highest_score: int
-    most_played_level: int
\ No newline at end of file
+    most_played_level: int
+
+class RollupPoint(BaseModel):
+    bucket: datetime
+    level: Optional[int] = None  # None cuando se agregan todos los niveles
+    games: int
+    average_score: float
+    max_score: int
+    average_time_played: float
+
+class SessionLengthBucket(BaseModel):
+    min_seconds: int
+    max_seconds: Optional[int] = None  # None para el último rango (sin límite)
+    games: int
+
+class LevelDistribution(BaseModel):
+    level: int
+    games: int
+    mean_score: float
+    percentiles: Dict[str, float]  # "p50", "p90", ...
+    histogram: List[int]  # Usa los mismos límites que ScoreDistribution.histogram_edges
+
+class FlaggedScore(BaseModel):
+    id: str
+    player_name: Optional[str] = None
+    score: Optional[int] = None
+    level: Optional[int] = None
+    time_played: Optional[int] = None
+    reason: str  # "score", "score_rate" o "time_played"
+    zscore: float
+
+class ScoreDistribution(BaseModel):
+    computed_at: datetime
+    total_games: int
+    score_percentiles: Dict[str, float]
+    time_played_percentiles: Dict[str, float]
+    histogram_edges: List[float]
+    histogram: List[int]
+    levels: List[LevelDistribution]
+    flagged_scores: List[FlaggedScore]
\ No newline at end of file
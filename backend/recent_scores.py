@@ -0,0 +1,174 @@
+"""
+Buffer circular en memoria con las últimas puntuaciones guardadas.
+
+Alimenta el ticker de "últimas partidas" (`GET /api/scores/recent`) sin
+consultar MongoDB en cada petición. Cada campo se guarda en su propio array de
+tamaño fijo, así que la memoria no crece con el tráfico.
+
+Cada worker sigue la colección `scores` con una tarea en segundo plano
+(`follow`) que cada `POLL_INTERVAL` segundos lee las puntuaciones nuevas, sin
+importar qué worker las guardó. Solo se publican las puntuaciones con más de
+`SETTLE_DELAY` de antigüedad, en orden de (timestamp, `_id`): así todos los
+workers publican la misma secuencia y el cursor (`since`), que es la clave de
+la última puntuación vista, es válido en cualquiera de ellos. Una puntuación
+que tarde más de `SETTLE_DELAY` en llegar a MongoDB no aparece en el ticker.
+"""
+
+import asyncio
+import logging
+from array import array
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from models import SCORE_FIELDS, Score
+import score_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 1024
+
+# Cada cuánto se consultan las puntuaciones nuevas
+POLL_INTERVAL = 1.0  # segundos
+
+# Margen para que una puntuación guardada en otro worker llegue a MongoDB
+# antes de publicar su intervalo de tiempo
+SETTLE_DELAY = timedelta(seconds=2)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_millis(timestamp: datetime) -> int:
+    return (timestamp - _EPOCH) // timedelta(milliseconds=1)
+
+
+def parse_cursor(cursor: str) -> Tuple[int, str]:
+    """Convertir un cursor `<epoch_ms>-<id>` en su clave de ordenación"""
+    millis, separator, score_id = cursor.partition("-")
+    if not separator or not millis.isdigit() or not score_id:
+        raise ValueError(f"Cursor no válido: {cursor}")
+    return int(millis), score_id
+
+
+class RecentScoresBuffer:
+    """Buffer circular columnar de puntuaciones ordenadas por (timestamp, id)"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.seq = 0  # Número de puntuaciones añadidas (índice interno, no es el cursor)
+        self.published_until: Optional[datetime] = None  # Fin del último intervalo leído de MongoDB
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._player_names: List[Optional[str]] = [None] * capacity
+        self._scores = array("q", bytes(8 * capacity))
+        self._levels = array("q", bytes(8 * capacity))
+        self._lives = array("q", bytes(8 * capacity))
+        self._time_played = array("q", bytes(8 * capacity))
+        self._timestamps = array("q", bytes(8 * capacity))  # epoch en milisegundos
+        self._latest = None  # (limit, scores) de la última lectura sin cursor
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return min(self.seq, self.capacity)
+
+    def append(self, score: Score):
+        """Añadir una puntuación posterior (en orden de clave) a todas las del buffer"""
+        slot = self.seq % self.capacity
+        self._ids[slot] = score.id
+        self._player_names[slot] = score.player_name
+        self._scores[slot] = score.score
+        self._levels[slot] = score.level
+        self._lives[slot] = score.lives_remaining
+        self._time_played[slot] = score.time_played
+        self._timestamps[slot] = _to_millis(score.timestamp)
+        self.seq += 1
+        self._latest = None
+
+    def _key(self, seq: int) -> Tuple[int, str]:
+        slot = seq % self.capacity
+        return self._timestamps[slot], self._ids[slot]
+
+    def _cursor(self, seq: int) -> str:
+        millis, score_id = self._key(seq)
+        return f"{millis}-{score_id}"
+
+    def _score(self, seq: int) -> Score:
+        slot = seq % self.capacity
+        return Score(
+            id=self._ids[slot],
+            player_name=self._player_names[slot],
+            score=self._scores[slot],
+            level=self._levels[slot],
+            lives_remaining=self._lives[slot],
+            time_played=self._time_played[slot],
+            timestamp=_EPOCH + timedelta(milliseconds=self._timestamps[slot])
+        )
+
+    def _first_after(self, key: Tuple[int, str]) -> int:
+        """Índice de la primera puntuación del buffer con clave mayor que `key`"""
+        low, high = max(self.seq - self.capacity, 0), self.seq
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) <= key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def read(self, since: Optional[str] = None, limit: int = 20) -> Tuple[List[Score], Optional[str]]:
+        """
+        Puntuaciones de la más reciente a la más antigua y el cursor a usar en
+        la siguiente lectura.
+
+        Sin `since` se retornan las `limit` últimas. Con `since` se retornan las
+        `limit` siguientes a ese cursor, de modo que una lectura truncada se
+        continúa en la siguiente sin saltarse puntuaciones. Si el cliente se
+        quedó atrás más de `capacity` puntuaciones, solo recibe las que siguen
+        en el buffer. Lanza ValueError si el cursor no es válido.
+        """
+        if since is None:
+            # Muchos espectadores piden la misma página entre dos partidas
+            if self._latest is not None and self._latest[0] == limit:
+                return self._latest[1], self._cursor(self.seq - 1) if self.seq else None
+            first, last = max(self.seq - self.capacity, self.seq - limit, 0), self.seq
+        else:
+            first = self._first_after(parse_cursor(since))
+            last = min(first + limit, self.seq)
+
+        scores = [self._score(seq) for seq in range(last - 1, first - 1, -1)]
+        if since is None:
+            self._latest = (limit, scores)
+        return scores, self._cursor(last - 1) if last > first else since
+
+    async def refresh(self, database):
+        """Publicar las puntuaciones guardadas en MongoDB desde la última lectura"""
+        async with self._lock:
+            until = datetime.utcnow() - SETTLE_DELAY
+            timestamp_field = SCORE_FIELDS["timestamp"]
+            query = {timestamp_field: {"$lt": until}}
+            if self.published_until is not None:
+                query[timestamp_field]["$gte"] = self.published_until
+
+            # Las más recientes primero para que un pico no supere la capacidad
+            documents = await database.scores.find(query).sort(
+                [(timestamp_field, -1), ("_id", -1)]
+            ).limit(self.capacity).to_list(self.capacity)
+            for score in reversed(await score_store.to_scores(database, documents)):
+                self.append(score)
+            self.published_until = until
+
+
+# Instancia compartida por las rutas y el precalentamiento
+recent_scores = RecentScoresBuffer()
+
+
+async def preload(database):
+    """Llenar el buffer con las últimas puntuaciones guardadas en MongoDB"""
+    await recent_scores.refresh(database)
+
+
+async def follow(database):
+    """Leer periódicamente las puntuaciones que guardan todos los workers"""
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        try:
+            await recent_scores.refresh(database)
+        except Exception as e:
+            logger.warning(f"No se pudieron leer las últimas puntuaciones: {e}")
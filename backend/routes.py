@@ -1,7 +1,25 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Header
 from typing import List, Optional
-from models import Demo, DemoCreate, Score, ScoreCreate, LeaderboardEntry, GameStats
+from models import (
+    Demo, DemoCreate, DemoSummary, DemoProjection, DemoSearchResult, Score, ScoreCreate,
+    RecentScores, LeaderboardEntry, GameStats, RollupPoint, SessionLengthBucket, ScoreDistribution, SCORE_FIELDS
+)
+from search import demo_index
 from datetime import datetime
+import asyncio
+import logging
+from pymongo import ReturnDocument
+import analytics
+import archive
+import score_store
+import idempotency
+from recent_scores import recent_scores
+import stats_engine
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre comprobaciones de la versión del catálogo de demos
+SEARCH_INDEX_REFRESH_INTERVAL = 30
 
 # Database will be injected from server.py
 db = None
@@ -202,35 +220,133 @@ this.player.setPipeline('Light2D');"""
     }
 ]
 
-@router.get("/demos", response_model=List[Demo])
-async def get_demos(level: Optional[str] = Query(None, description="Filtrar por nivel: basic, intermediate, advanced")):
+async def seed_initial_demos(database):
+    """Insertar las demos iniciales si la colección está vacía"""
+    # Verificar si ya existen demos en la base de datos
+    count = await database.demos.count_documents({})
+    
+    # Si no hay demos, insertar las demos iniciales
+    if count == 0:
+        initial_demos = []
+        for demo_data in INITIAL_DEMOS:
+            demo = Demo(**demo_data)
+            initial_demos.append(demo.dict())
+        
+        if initial_demos:
+            await database.demos.insert_many([dict(demo) for demo in initial_demos])
+            await bump_demo_version(database)
+
+async def current_demo_version(database) -> int:
+    """Versión del catálogo de demos (cambia con cada creación o borrado)"""
+    counter = await database.counters.find_one({"_id": "demos"})
+    return counter["seq"] if counter else 0
+
+async def bump_demo_version(database) -> int:
+    """Registrar un cambio en el catálogo para que los demás workers reconstruyan su índice"""
+    counter = await database.counters.find_one_and_update(
+        {"_id": "demos"}, {"$inc": {"seq": 1}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def build_search_index(database):
+    """Construir el índice de búsqueda de demos desde MongoDB"""
+    await seed_initial_demos(database)
+    # Leer la versión antes que las demos: un cambio concurrente provoca otra reconstrucción
+    version = await current_demo_version(database)
+    demos = await database.demos.find({}, {"_id": 0}).to_list(None)
+    demo_index.build(demos)
+    demo_index.version = version
+    return len(demo_index)
+
+def apply_local_change(version: int):
+    """Avanzar la versión del índice tras aplicar un cambio hecho por este worker"""
+    # Si otro worker cambió el catálogo entre medias, el refresco periódico reconstruye el índice
+    if demo_index.version == version - 1:
+        demo_index.version = version
+
+async def refresh_search_index(database) -> bool:
+    """Reconstruir el índice si el catálogo cambió en MongoDB; retorna True si se reconstruyó"""
+    if demo_index.ready and demo_index.version == await current_demo_version(database):
+        return False
+    await build_search_index(database)
+    return True
+
+async def keep_search_index_fresh(database):
+    """Comprobar periódicamente la versión del catálogo (cambios de otros workers)"""
+    while True:
+        await asyncio.sleep(SEARCH_INDEX_REFRESH_INTERVAL)
+        try:
+            if await refresh_search_index(database):
+                logger.info(f"Índice de búsqueda reconstruido (versión {demo_index.version})")
+        except Exception as e:
+            logger.warning(f"No se pudo refrescar el índice de búsqueda: {e}")
+
+def parse_demo_fields(fields: str) -> List[str]:
+    """Convertir el parámetro `fields` en una lista de campos válidos de Demo"""
+    if fields.strip() == "summary":
+        return list(DemoSummary.model_fields)
+    
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    invalid = [field for field in requested if field not in Demo.model_fields]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Campos no válidos: {', '.join(invalid)}")
+    
+    # El id siempre se incluye para poder cargar la demo completa después
+    return ["id"] + [field for field in requested if field != "id"]
+
+@router.get("/demos", response_model=List[DemoProjection], response_model_exclude_unset=True)
+async def get_demos(
+    level: Optional[str] = Query(None, description="Filtrar por nivel: basic, intermediate, advanced"),
+    fields: Optional[str] = Query(None, description="Campos a retornar separados por coma, o 'summary' para la vista de lista")
+):
     """Obtener todas las demos o filtrar por nivel"""
     try:
         database = get_database()
-        # Verificar si ya existen demos en la base de datos
-        count = await database.demos.count_documents({})
-        
-        # Si no hay demos, insertar las demos iniciales
-        if count == 0:
-            initial_demos = []
-            for demo_data in INITIAL_DEMOS:
-                demo = Demo(**demo_data)
-                initial_demos.append(demo.dict())
-            
-            if initial_demos:
-                await database.demos.insert_many(initial_demos)
+        await seed_initial_demos(database)
         
         # Construir filtro
         filter_dict = {}
         if level:
             filter_dict["level"] = level
         
-        demos = await database.demos.find(filter_dict).to_list(1000)
-        return [Demo(**demo) for demo in demos]
+        if not fields:
+            demos = await database.demos.find(filter_dict).to_list(1000)
+            return [Demo(**demo) for demo in demos]
+        
+        # Proyección en MongoDB para no transferir campos pesados como code_example
+        projection = {field: 1 for field in parse_demo_fields(fields)}
+        projection["_id"] = 0
+        demos = await database.demos.find(filter_dict, projection).to_list(1000)
+        return [DemoProjection(**demo) for demo in demos]
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener demos: {str(e)}")
 
+@router.get("/demos/search", response_model=DemoSearchResult)
+async def search_demos(
+    q: Optional[str] = Query(None, description="Texto a buscar en título, descripción y código"),
+    technologies: Optional[List[str]] = Query(None, description="Filtrar por tecnologías (todas deben coincidir)"),
+    level: Optional[str] = Query(None, description="Filtrar por nivel: basic, intermediate, advanced"),
+    limit: int = Query(50, ge=1, le=100, description="Número máximo de resultados")
+):
+    """Buscar demos usando el índice invertido en memoria"""
+    try:
+        if not demo_index.ready:
+            await build_search_index(get_database())
+        
+        results, total, facets = demo_index.search(q, technologies, level, limit)
+        return DemoSearchResult(
+            total=total,
+            results=[Demo(**demo) for demo in results],
+            facets=facets
+        )
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al buscar demos: {str(e)}")
+
 @router.get("/demos/{demo_id}", response_model=Demo)
 async def get_demo(demo_id: str):
     """Obtener una demo específica por ID"""
@@ -247,24 +363,76 @@ async def get_demo(demo_id: str):
         raise HTTPException(status_code=500, detail=f"Error al obtener demo: {str(e)}")
 
 @router.post("/scores", response_model=Score)
-async def save_score(score_data: ScoreCreate):
+async def save_score(
+    score_data: ScoreCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=idempotency.MAX_KEY_LENGTH, description="Clave para que los reintentos no dupliquen la puntuación")
+):
     """Guardar puntuación del juego"""
     try:
         database = get_database()
-        score = Score(**score_data.dict())
-        await database.scores.insert_one(score.dict())
+        # MongoDB guarda las fechas con precisión de milisegundos: truncar aquí
+        # para que un reintento devuelva exactamente la misma Score
+        now = datetime.utcnow()
+        score = Score(timestamp=now.replace(microsecond=now.microsecond // 1000 * 1000), **score_data.dict())
+        
+        if idempotency_key:
+            # Un reintento de una puntuación ya guardada la devuelve sin volver a escribirla
+            score, committed = await idempotency.begin(database, idempotency_key, score_data, score)
+            if committed:
+                return score
+        
+        # Si la clave estaba pendiente se guarda la misma Score (mismo _id), así
+        # que solo la petición que la escribe actualiza los rollups
+        inserted = await score_store.insert_score(database, score)
+        if idempotency_key:
+            await idempotency.commit(database, idempotency_key)
+        if not inserted:
+            return score
+        
+        # Un fallo en los rollups no debe hacer que el cliente reintente la puntuación
+        try:
+            await analytics.record_score(database, score.dict())
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar los rollups de la puntuación {score.id}: {e}")
+        
         return score
     
+    except idempotency.IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="La clave de idempotencia ya se usó con otra puntuación")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al guardar puntuación: {str(e)}")
 
+@router.get("/scores/recent", response_model=RecentScores)
+async def get_recent_scores(
+    since: Optional[str] = Query(None, max_length=64, description="Cursor retornado por la consulta anterior (válido en cualquier worker)"),
+    limit: int = Query(20, ge=1, le=100, description="Número máximo de puntuaciones a retornar")
+):
+    """Últimas puntuaciones guardadas (por cualquier worker), servidas desde el buffer en memoria"""
+    try:
+        scores, cursor = recent_scores.read(since, limit)
+        return RecentScores(cursor=cursor, scores=scores)
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener últimas puntuaciones: {str(e)}")
+
 @router.get("/scores/leaderboard", response_model=List[LeaderboardEntry])
-async def get_leaderboard(limit: int = Query(10, description="Número de entradas a retornar")):
+async def get_leaderboard(
+    limit: int = Query(10, ge=1, le=archive.TOP_SCORES_PER_PARTITION, description="Número de entradas a retornar"),
+    include_archive: bool = Query(True, description="Incluir las puntuaciones archivadas en disco")
+):
     """Obtener tabla de puntuaciones"""
     try:
         database = get_database()
         # Obtener top scores ordenados por puntuación descendente
-        scores = await database.scores.find().sort("score", -1).limit(limit).to_list(limit)
+        documents = await database.scores.find().sort(SCORE_FIELDS["score"], -1).limit(limit).to_list(limit)
+        scores = [score.dict() for score in await score_store.to_scores(database, documents)]
+        
+        # Las puntuaciones archivadas se leen de los resúmenes de partición
+        if include_archive:
+            scores += await archive.archived_top_scores(database, limit)
+            scores = sorted(scores, key=lambda score_doc: score_doc["score"], reverse=True)[:limit]
         
         leaderboard = []
         for idx, score_doc in enumerate(scores, 1):
@@ -282,54 +450,160 @@ async def get_leaderboard(limit: int = Query(10, description="Número de entrada
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener leaderboard: {str(e)}")
 
+@router.get("/scores/archive", response_model=List[Score])
+async def get_archived_scores(
+    since: datetime = Query(..., description="Inicio del rango (UTC)"),
+    until: Optional[datetime] = Query(None, description="Fin del rango (UTC)"),
+    limit: int = Query(1000, ge=1, le=10000, description="Número máximo de puntuaciones a retornar")
+):
+    """Leer puntuaciones antiguas desde el archivo en disco"""
+    try:
+        database = get_database()
+        frame = await archive.read_archived_scores(database, since, until or datetime.utcnow(), limit)
+        return [Score(**row) for row in frame.to_dict("records")]
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al leer puntuaciones archivadas: {str(e)}")
+
 @router.get("/stats", response_model=GameStats)
 async def get_game_stats():
-    """Obtener estadísticas generales del juego"""
+    """Obtener estadísticas generales del juego (incluye las puntuaciones archivadas)"""
     try:
         database = get_database()
-        # Contar total de juegos
-        total_games = await database.scores.count_documents({})
         
-        if total_games == 0:
-            return GameStats(
-                total_games=0,
-                average_score=0.0,
-                highest_score=0,
-                most_played_level=1
-            )
-        
-        # Calcular estadísticas usando agregación
+        # Calcular estadísticas por nivel usando agregación, sin traer los
+        # niveles de cada partida a Python (los documentos aún sin migrar
+        # usan los nombres de campo completos)
         pipeline = [
             {
                 "$group": {
-                    "_id": None,
-                    "avg_score": {"$avg": "$score"},
-                    "max_score": {"$max": "$score"},
-                    "levels": {"$push": "$level"}
+                    "_id": {"$ifNull": [f"${SCORE_FIELDS['level']}", "$level"]},
+                    "games": {"$sum": 1},
+                    "score_sum": {"$sum": {"$ifNull": [f"${SCORE_FIELDS['score']}", "$score"]}},
+                    "max_score": {"$max": {"$ifNull": [f"${SCORE_FIELDS['score']}", "$score"]}}
                 }
             }
         ]
         
-        result = await database.scores.aggregate(pipeline).to_list(1)
-        stats_data = result[0] if result else {}
+        per_level = await database.scores.aggregate(pipeline).to_list(None)
+        per_level += await archive.archived_level_totals(database)
         
-        # Encontrar el nivel más jugado
-        level_counts = {}
-        for level in stats_data.get("levels", []):
-            level_counts[level] = level_counts.get(level, 0) + 1
+        # Combinar los totales de la colección activa y del archivo
+        levels = {}
+        for level_stats in per_level:
+            totals = levels.setdefault(level_stats["_id"], {"games": 0, "score_sum": 0, "max_score": 0})
+            totals["games"] += level_stats["games"]
+            totals["score_sum"] += level_stats["score_sum"]
+            totals["max_score"] = max(totals["max_score"], level_stats["max_score"])
         
-        most_played_level = max(level_counts.keys(), key=level_counts.get) if level_counts else 1
+        total_games = sum(totals["games"] for totals in levels.values())
+        if total_games == 0:
+            return GameStats(
+                total_games=0,
+                average_score=0.0,
+                highest_score=0,
+                most_played_level=1
+            )
         
         return GameStats(
             total_games=total_games,
-            average_score=round(stats_data.get("avg_score", 0), 2),
-            highest_score=stats_data.get("max_score", 0),
-            most_played_level=most_played_level
+            average_score=round(sum(totals["score_sum"] for totals in levels.values()) / total_games, 2),
+            highest_score=max(totals["max_score"] for totals in levels.values()),
+            most_played_level=max(levels, key=lambda level: levels[level]["games"])
         )
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener estadísticas: {str(e)}")
 
+@router.get("/stats/distribution", response_model=ScoreDistribution)
+async def get_score_distribution():
+    """Obtener percentiles, histogramas y puntuaciones sospechosas precalculados"""
+    try:
+        database = get_database()
+        stats = await stats_engine.get_stats(database)
+        if not stats:
+            raise HTTPException(status_code=404, detail="Estadísticas aún no calculadas (ejecutar stats_engine.py)")
+        return ScoreDistribution(**stats)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener distribución de puntuaciones: {str(e)}")
+
+@router.get("/analytics/timeseries", response_model=List[RollupPoint])
+async def get_score_timeseries(
+    granularity: str = Query("hour", description="Tamaño del bucket: minute, hour, day"),
+    since: Optional[datetime] = Query(None, description="Inicio del rango (UTC)"),
+    until: Optional[datetime] = Query(None, description="Fin del rango (UTC)"),
+    level: Optional[int] = Query(None, description="Filtrar por nivel del juego"),
+    by_level: bool = Query(False, description="Retornar una serie por nivel en lugar de agregarlos")
+):
+    """Partidas y puntuación media por periodo, leídas de los rollups"""
+    try:
+        if granularity not in analytics.GRANULARITIES:
+            raise HTTPException(status_code=400, detail=f"Granularidad no válida: {granularity}")
+        
+        database = get_database()
+        rollups = await analytics.query_rollups(database, granularity, since, until, level)
+        
+        # Combinar los rollups de cada bucket (y nivel, si se pide por nivel)
+        points = {}
+        for rollup in rollups:
+            key = (rollup["bucket"], rollup["level"] if by_level else None)
+            point = points.setdefault(key, {"games": 0, "score_sum": 0, "time_sum": 0, "max_score": 0})
+            point["games"] += rollup["games"]
+            point["score_sum"] += rollup["score_sum"]
+            point["time_sum"] += rollup["time_sum"]
+            point["max_score"] = max(point["max_score"], rollup["max_score"])
+        
+        return [
+            RollupPoint(
+                bucket=bucket,
+                level=point_level,
+                games=point["games"],
+                average_score=round(point["score_sum"] / point["games"], 2),
+                max_score=point["max_score"],
+                average_time_played=round(point["time_sum"] / point["games"], 2)
+            )
+            for (bucket, point_level), point in sorted(points.items(), key=lambda item: (item[0][0], item[0][1] or 0))
+        ]
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener serie temporal: {str(e)}")
+
+@router.get("/analytics/session-lengths", response_model=List[SessionLengthBucket])
+async def get_session_lengths(
+    granularity: str = Query("day", description="Rollups a usar: minute, hour, day"),
+    since: Optional[datetime] = Query(None, description="Inicio del rango (UTC)"),
+    until: Optional[datetime] = Query(None, description="Fin del rango (UTC)"),
+    level: Optional[int] = Query(None, description="Filtrar por nivel del juego")
+):
+    """Distribución de la duración de las partidas, leída de los rollups"""
+    try:
+        if granularity not in analytics.GRANULARITIES:
+            raise HTTPException(status_code=400, detail=f"Granularidad no válida: {granularity}")
+        
+        database = get_database()
+        rollups = await analytics.query_rollups(database, granularity, since, until, level)
+        
+        counts = {lower: 0 for lower in analytics.SESSION_BUCKETS}
+        for rollup in rollups:
+            for lower, games in rollup.get("sessions", {}).items():
+                counts[int(lower)] += games
+        
+        bounds = analytics.SESSION_BUCKETS + [None]
+        return [
+            SessionLengthBucket(min_seconds=lower, max_seconds=bounds[idx + 1], games=counts[lower])
+            for idx, lower in enumerate(analytics.SESSION_BUCKETS)
+        ]
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener duración de partidas: {str(e)}")
+
 @router.delete("/demos/{demo_id}")
 async def delete_demo(demo_id: str):
     """Eliminar una demo (para propósitos de administración)"""
@@ -338,6 +612,9 @@ async def delete_demo(demo_id: str):
         result = await database.demos.delete_one({"id": demo_id})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Demo no encontrada")
+        version = await bump_demo_version(database)
+        demo_index.remove(demo_id)
+        apply_local_change(version)
         return {"message": "Demo eliminada exitosamente"}
     
     except HTTPException:
@@ -352,6 +629,9 @@ async def create_demo(demo_data: DemoCreate):
         database = get_database()
         demo = Demo(**demo_data.dict())
         await database.demos.insert_one(demo.dict())
+        version = await bump_demo_version(database)
+        demo_index.add(demo.dict())
+        apply_local_change(version)
         return demo
     
     except Exception as e:
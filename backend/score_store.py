@@ -0,0 +1,240 @@
+"""
+Almacenamiento compacto de puntuaciones.
+
+Cada documento de `scores` usa su `_id` (ObjectId) como única clave, guarda
+los campos con nombres cortos (ver `ScoreDocument` en models.py) y referencia
+al jugador con un entero de la colección `players` en lugar de repetir su
+nombre en cada partida.
+
+Los documentos con el esquema anterior (`id` uuid4 y `player_name`) los
+migra en segundo plano un único worker: el primero que reserva la migración
+en `counters` durante su precalentamiento (`ensure_score_schema`). Ningún
+worker espera a que termine, ya que las lecturas aceptan ambos esquemas.
+Orden de despliegue: desplegar los workers nuevos y, cuando no quede ninguno
+con la versión anterior (que sigue escribiendo el esquema antiguo), ejecutar:
+
+    python score_store.py migrate
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+from bson import ObjectId
+from pymongo import DESCENDING, ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from models import SCORE_FIELDS, Score, ScoreDocument
+
+logger = logging.getLogger(__name__)
+
+PLAYERS_COLLECTION = "players"
+COUNTERS_COLLECTION = "counters"
+
+# Documento de `counters` que reserva la migración al esquema compacto
+# (`state`: "in_progress" mientras un worker migra, "done" al terminar)
+SCHEMA_MARKER = "scores_schema"
+
+# Tiempo tras el que otro worker puede retomar una migración reservada por un
+# worker que murió sin terminarla
+MIGRATION_LEASE = timedelta(hours=1)
+
+# Número máximo de jugadores que se mantienen en caché en memoria
+PLAYER_CACHE_SIZE = 10000
+
+_player_ids: "OrderedDict[str, int]" = OrderedDict()
+_player_names: "OrderedDict[int, str]" = OrderedDict()
+
+# Migración lanzada por este worker (se guarda la referencia para que no se recolecte)
+_migration_task = None
+
+
+def _cache_player(player_id: int, name: str):
+    for cache, key, value in ((_player_ids, name, player_id), (_player_names, player_id, name)):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > PLAYER_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+async def ensure_score_indexes(database):
+    """Crear los índices de puntuaciones y jugadores"""
+    await database.scores.create_index([(SCORE_FIELDS["score"], DESCENDING)])
+    await database[PLAYERS_COLLECTION].create_index("name", unique=True)
+
+
+async def intern_player(database, name: str) -> int:
+    """Obtener (o asignar) el id numérico de un jugador"""
+    if name in _player_ids:
+        _player_ids.move_to_end(name)
+        return _player_ids[name]
+
+    players = database[PLAYERS_COLLECTION]
+    player = await players.find_one({"name": name})
+    if not player:
+        counter = await database[COUNTERS_COLLECTION].find_one_and_update(
+            {"_id": PLAYERS_COLLECTION}, {"$inc": {"seq": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        player = {"_id": counter["seq"], "name": name}
+        try:
+            await players.insert_one(player)
+        except DuplicateKeyError:
+            # Otro proceso registró al mismo jugador a la vez
+            player = await players.find_one({"name": name})
+
+    _cache_player(player["_id"], name)
+    return player["_id"]
+
+
+async def player_names(database, player_ids: Iterable[int]) -> Dict[int, str]:
+    """Resolver ids de jugador a nombres (primero en caché, luego en MongoDB)"""
+    names = {}
+    missing = []
+    for player_id in set(player_ids):
+        if player_id in _player_names:
+            names[player_id] = _player_names[player_id]
+        else:
+            missing.append(player_id)
+
+    if missing:
+        async for player in database[PLAYERS_COLLECTION].find({"_id": {"$in": missing}}):
+            _cache_player(player["_id"], player["name"])
+            names[player["_id"]] = player["name"]
+    return names
+
+
+def read_field(document: dict, field: str):
+    """Valor de un campo en un documento compacto o con el esquema anterior"""
+    alias = SCORE_FIELDS[field]
+    return document[alias] if alias in document else document[field]
+
+
+def fields_projection(fields: Iterable[str]) -> dict:
+    """Proyección que incluye cada campo con su nombre compacto y el anterior"""
+    projection = {}
+    for field in fields:
+        projection[SCORE_FIELDS[field]] = 1
+        projection[field] = 1
+    return projection
+
+
+def legacy_score(document: dict) -> Score:
+    """Convertir un documento con el esquema anterior en una Score de la API"""
+    return Score(id=str(document["_id"]), **{k: v for k, v in document.items() if k not in ("_id", "id")})
+
+
+def to_document(score: Score, player_id: int) -> dict:
+    """Convertir una Score de la API en un documento compacto de MongoDB"""
+    document = ScoreDocument(player_id=player_id, **score.dict(exclude={"id", "player_name"})).dict(by_alias=True)
+    document["_id"] = ObjectId(score.id)
+    return document
+
+
+async def insert_score(database, score: Score) -> bool:
+    """
+    Guardar una puntuación con el esquema compacto. Retorna False si ya
+    estaba guardada (reintento de una petición con clave de idempotencia).
+    """
+    player_id = await intern_player(database, score.player_name)
+    try:
+        await database.scores.insert_one(to_document(score, player_id))
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def to_scores(database, documents: List[dict]) -> List[Score]:
+    """Convertir documentos compactos (o sin migrar todavía) en Scores de la API"""
+    stored = [None if "player_name" in document else ScoreDocument(**document) for document in documents]
+    names = await player_names(database, (score.player_id for score in stored if score))
+    return [
+        Score(id=str(document["_id"]), player_name=names.get(score.player_id, ""), **score.dict(exclude={"player_id"}))
+        if score else legacy_score(document)
+        for document, score in zip(documents, stored)
+    ]
+
+
+async def migrate_scores(database, batch_size: int = 1000) -> int:
+    """Reescribir los documentos de `scores` con el esquema anterior"""
+    migrated = 0
+    operations = []
+    async for legacy in database.scores.find({"player_name": {"$exists": True}}).batch_size(batch_size):
+        player_id = await intern_player(database, legacy["player_name"])
+        operations.append(ReplaceOne({"_id": legacy["_id"]}, to_document(legacy_score(legacy), player_id)))
+        if len(operations) >= batch_size:
+            await database.scores.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+            operations = []
+
+    if operations:
+        await database.scores.bulk_write(operations, ordered=False)
+        migrated += len(operations)
+
+    # El índice sobre el antiguo campo `id` ya no tiene uso
+    try:
+        await database.scores.drop_index("id_1")
+    except OperationFailure:
+        pass
+
+    await database[COUNTERS_COLLECTION].update_one(
+        {"_id": SCHEMA_MARKER}, {"$set": {"state": "done", "migrated_at": datetime.utcnow()}}, upsert=True
+    )
+    return migrated
+
+
+async def claim_schema_migration(database) -> bool:
+    """Reservar la migración para este worker; False si otro ya la hizo o la está haciendo"""
+    counters = database[COUNTERS_COLLECTION]
+    now = datetime.utcnow()
+    try:
+        await counters.insert_one({"_id": SCHEMA_MARKER, "state": "in_progress", "claimed_at": now})
+        return True
+    except DuplicateKeyError:
+        pass
+    # Retomar una reserva abandonada
+    stale = await counters.find_one_and_update(
+        {"_id": SCHEMA_MARKER, "state": "in_progress", "claimed_at": {"$lt": now - MIGRATION_LEASE}},
+        {"$set": {"claimed_at": now}}
+    )
+    return stale is not None
+
+
+async def _migrate_in_background(database):
+    try:
+        migrated = await migrate_scores(database)
+        logger.info(f"{migrated} puntuaciones migradas al esquema compacto")
+    except Exception as e:
+        # La reserva caduca y otro worker (o el CLI) puede retomarla
+        logger.warning(f"Falló la migración al esquema compacto: {e}")
+
+
+async def ensure_score_schema(database):
+    """Lanzar en segundo plano la migración de `scores` si este worker la reserva"""
+    global _migration_task
+    if await claim_schema_migration(database):
+        _migration_task = asyncio.create_task(_migrate_in_background(database))
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    if sys.argv[1:] != ["migrate"]:
+        print("Uso: python score_store.py migrate")
+        sys.exit(1)
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        database = client[os.environ['DB_NAME']]
+        await ensure_score_indexes(database)
+        migrated = await migrate_scores(database)
+        print(f"{migrated} puntuaciones migradas al esquema compacto")
+        client.close()
+
+    asyncio.run(main())
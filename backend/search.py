@@ -0,0 +1,203 @@
+"""
+Índice invertido en memoria para buscar demos por texto y tecnologías.
+
+El índice se construye al arrancar el servidor y se mantiene actualizado
+cuando se crean o eliminan demos, de modo que las búsquedas nunca consultan
+MongoDB. Los cambios hechos por otros workers se detectan comparando la
+versión del catálogo guardada en MongoDB (ver `refresh_search_index` en
+routes.py), así que pueden tardar hasta un intervalo de refresco en verse.
+"""
+
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Peso de cada campo al puntuar un resultado
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "technologies": 2.0,
+    "description": 1.0,
+    "code_example": 0.5,
+}
+
+# Palabras vacías en español que no aportan a la búsqueda
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "e", "el", "en", "es", "la", "las", "lo",
+    "los", "o", "para", "por", "se", "su", "sus", "un", "una", "y",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Pasar a minúsculas y eliminar acentos ("Físicas" -> "fisicas")"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    """Dividir un texto en tokens normalizados sin palabras vacías"""
+    return [tok for tok in _TOKEN_RE.findall(normalize(text)) if tok not in STOPWORDS]
+
+
+class DemoSearchIndex:
+    """Índice invertido sobre los campos de texto de las demos"""
+
+    def __init__(self):
+        self._docs: Dict[str, dict] = {}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._tags: Dict[str, Set[str]] = {}
+        self._tag_labels: Dict[str, str] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self.ready = False
+        # Versión del catálogo en MongoDB con la que se construyó el índice
+        self.version = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def build(self, demos: Iterable[dict]):
+        """Reconstruir el índice completo a partir de documentos de demos"""
+        self._docs.clear()
+        self._postings.clear()
+        self._tags.clear()
+        self._tag_labels.clear()
+        self._vocabulary_dirty = True
+        for demo in demos:
+            self.add(demo)
+        self.ready = True
+
+    def add(self, demo: dict):
+        """Indexar (o reindexar) una demo"""
+        demo_id = demo["id"]
+        if demo_id in self._docs:
+            self.remove(demo_id)
+        self._docs[demo_id] = demo
+
+        for field, weight in FIELD_WEIGHTS.items():
+            value = demo.get(field) or ""
+            if isinstance(value, list):
+                value = " ".join(value)
+            for token in tokenize(value):
+                postings = self._postings.setdefault(token, {})
+                if not postings:
+                    self._vocabulary_dirty = True
+                postings[demo_id] = postings.get(demo_id, 0.0) + weight
+
+        for tag in demo.get("technologies", []):
+            key = normalize(tag)
+            self._tags.setdefault(key, set()).add(demo_id)
+            self._tag_labels.setdefault(key, tag)
+
+    def remove(self, demo_id: str):
+        """Quitar una demo del índice"""
+        demo = self._docs.pop(demo_id, None)
+        if demo is None:
+            return
+
+        for field in FIELD_WEIGHTS:
+            value = demo.get(field) or ""
+            if isinstance(value, list):
+                value = " ".join(value)
+            for token in set(tokenize(value)):
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(demo_id, None)
+                if not postings:
+                    del self._postings[token]
+                    self._vocabulary_dirty = True
+
+        for tag in demo.get("technologies", []):
+            key = normalize(tag)
+            ids = self._tags.get(key)
+            if ids is None:
+                continue
+            ids.discard(demo_id)
+            if not ids:
+                del self._tags[key]
+                del self._tag_labels[key]
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        """Tokens del vocabulario que empiezan por el prefijo dado"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect_left(self._vocabulary, prefix)
+        matches = []
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            matches.append(token)
+        return matches
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        technologies: Optional[List[str]] = None,
+        level: Optional[str] = None,
+        limit: int = 50,
+    ) -> Tuple[List[dict], int, Dict[str, int]]:
+        """
+        Buscar demos que contengan todos los términos de la consulta y todas
+        las tecnologías indicadas. El último término se trata como prefijo
+        para permitir búsquedas mientras el usuario escribe.
+
+        Retorna (resultados, total, facetas de tecnologías con conteos).
+        """
+        scores: Optional[Dict[str, float]] = None
+
+        tokens = tokenize(query) if query else []
+        if query and not tokens:
+            # La consulta solo tenía palabras vacías: no filtra nada útil
+            scores = {}
+        for position, token in enumerate(tokens):
+            if position == len(tokens) - 1:
+                candidates = self._expand_prefix(token)
+            else:
+                candidates = [token] if token in self._postings else []
+
+            token_scores: Dict[str, float] = {}
+            for candidate in candidates:
+                for demo_id, weight in self._postings[candidate].items():
+                    token_scores[demo_id] = token_scores.get(demo_id, 0.0) + weight
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    demo_id: score + token_scores[demo_id]
+                    for demo_id, score in scores.items()
+                    if demo_id in token_scores
+                }
+            if not scores:
+                break
+
+        if scores is None:
+            scores = dict.fromkeys(self._docs, 0.0)
+
+        for tag in technologies or []:
+            ids = self._tags.get(normalize(tag), set())
+            scores = {demo_id: score for demo_id, score in scores.items() if demo_id in ids}
+
+        if level:
+            scores = {
+                demo_id: score for demo_id, score in scores.items()
+                if self._docs[demo_id].get("level") == level
+            }
+
+        facets: Dict[str, int] = {}
+        for demo_id in scores:
+            # Cada demo cuenta una vez por tecnología aunque la repita
+            for key in {normalize(tag) for tag in self._docs[demo_id].get("technologies", [])}:
+                label = self._tag_labels[key]
+                facets[label] = facets.get(label, 0) + 1
+
+        ranked = sorted(scores, key=lambda demo_id: (-scores[demo_id], self._docs[demo_id]["title"]))
+        return [self._docs[demo_id] for demo_id in ranked[:limit]], len(ranked), facets
+
+
+# Instancia compartida por las rutas y el arranque del servidor
+demo_index = DemoSearchIndex()
@@ -4,9 +4,13 @@ from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
 import routes
+import health
+import telemetry
+import recent_scores
 from routes import router as api_routes
 
 ROOT_DIR = Path(__file__).parent
@@ -31,6 +35,12 @@ api_router = APIRouter(prefix="/api")
 async def root():
     return {"message": "Phaser.js Demo API is running!", "version": "1.0.0"}
 
+# Liveness and readiness probes
+api_router.include_router(health.router)
+
+# Gameplay telemetry ingestion
+api_router.include_router(telemetry.router)
+
 # Include all the demo and score routes
 api_router.include_router(api_routes)
 
@@ -59,8 +69,19 @@ logger = logging.getLogger(__name__)
 async def startup_event():
     logger.info("Starting Phaser.js Demo API server...")
     logger.info(f"Connected to MongoDB: {mongo_url}")
+    # Warm up in the background so liveness answers while readiness reports 503
+    app.state.warm_up_task = asyncio.create_task(health.warm_up(db))
+    telemetry.writer.start(db)
+    # Pick up demo catalog changes made by other workers
+    app.state.search_refresh_task = asyncio.create_task(routes.keep_search_index_fresh(db))
+    # Feed the latest-games ticker with scores saved by every worker
+    app.state.recent_scores_task = asyncio.create_task(recent_scores.follow(db))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     logger.info("Shutting down Phaser.js Demo API server...")
+    app.state.warm_up_task.cancel()
+    app.state.search_refresh_task.cancel()
+    app.state.recent_scores_task.cancel()
+    await telemetry.writer.stop()
     client.close()
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+Motor de estadísticas por lotes sobre la colección `scores` y las
+puntuaciones archivadas en disco por `archive.py`.
+
+Las puntuaciones se leen en lotes BSON sin procesar (`find_raw_batches`) que
+se convierten de golpe en columnas (un array de NumPy por campo), y todas las
+métricas se calculan con operaciones vectorizadas. El resultado
+se guarda en la colección `score_stats`, desde donde lo sirve la API.
+
+Para recalcular las estadísticas:
+
+    python stats_engine.py
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List
+from bson import ObjectId
+import bson
+import numpy as np
+import pandas as pd
+from models import SCORE_FIELDS
+import archive
+import score_store
+
+STATS_COLLECTION = "score_stats"
+STATS_DOCUMENT_ID = "latest"
+
+PERCENTILES = [50, 75, 90, 95, 99]
+HISTOGRAM_BINS = 20
+
+# Umbral del z-score robusto (basado en la mediana y la MAD) para marcar una
+# puntuación como sospechosa dentro de su nivel
+OUTLIER_THRESHOLD = 6.0
+MAX_FLAGGED = 100
+
+_COLUMNS = {"score": np.int64, "level": np.int64, "time_played": np.int64}
+
+
+def _batch_column(frame: pd.DataFrame, name: str) -> pd.Series:
+    """Columna de un lote, tomando el nombre completo en documentos sin migrar"""
+    alias = SCORE_FIELDS[name]
+    column = frame[alias] if alias in frame else pd.Series(np.nan, index=frame.index)
+    if name in frame:
+        column = column.fillna(frame[name])
+    return column
+
+
+async def load_score_columns(database, chunk_size: int = 10000) -> Dict[str, np.ndarray]:
+    """Leer `scores` y el archivo en disco por lotes y retornar un array por columna"""
+    chunks: Dict[str, List[np.ndarray]] = {name: [] for name in list(_COLUMNS) + ["id"]}
+
+    projection = score_store.fields_projection(_COLUMNS)
+    async for batch in database.scores.find_raw_batches({}, projection, batch_size=chunk_size):
+        frame = pd.DataFrame(bson.decode_all(batch))
+        if frame.empty:
+            continue
+        chunks["id"].append(frame["_id"].astype(str).to_numpy(dtype=object))
+        for name, dtype in _COLUMNS.items():
+            chunks[name].append(_batch_column(frame, name).to_numpy(dtype=dtype))
+
+    # Las puntuaciones archivadas se leen partición a partición
+    async for frame in archive.iter_archived_frames(database, columns=list(chunks)):
+        for name in chunks:
+            chunks[name].append(frame[name].to_numpy(dtype=_COLUMNS.get(name, object)))
+
+    return {
+        name: np.concatenate(parts) if parts else np.array([], dtype=_COLUMNS.get(name, object))
+        for name, parts in chunks.items()
+    }
+
+
+def _percentiles(values: np.ndarray) -> Dict[str, float]:
+    if len(values) == 0:
+        return {f"p{p}": 0.0 for p in PERCENTILES}
+    return {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def _robust_zscores(frame: pd.DataFrame, column: str) -> pd.Series:
+    """z-score robusto de una columna calculado dentro de cada nivel"""
+    grouped = frame.groupby("level")[column]
+    median = grouped.transform("median")
+    mad = (frame[column] - median).abs().groupby(frame["level"]).transform("median")
+    # Con MAD nula (todas las puntuaciones iguales) no hay dispersión que medir
+    scale = (1.4826 * mad).replace(0, np.nan)
+    return ((frame[column] - median) / scale).fillna(0.0)
+
+
+def compute_stats(columns: Dict[str, np.ndarray]) -> dict:
+    """Calcular distribuciones, histogramas y puntuaciones sospechosas"""
+    frame = pd.DataFrame(columns)
+    scores = frame["score"].to_numpy()
+    total_games = len(frame)
+
+    if total_games:
+        edges = np.histogram_bin_edges(scores, bins=HISTOGRAM_BINS)
+        histogram, _ = np.histogram(scores, bins=edges)
+    else:
+        edges, histogram = np.zeros(HISTOGRAM_BINS + 1), np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+
+    levels = []
+    for level, group in frame.groupby("level", sort=True):
+        level_scores = group["score"].to_numpy()
+        level_histogram, _ = np.histogram(level_scores, bins=edges)
+        levels.append({
+            "level": int(level),
+            "games": int(len(group)),
+            "mean_score": round(float(level_scores.mean()), 2),
+            "percentiles": _percentiles(level_scores),
+            "histogram": level_histogram.tolist(),
+        })
+
+    flagged = []
+    if total_games:
+        # Puntos por segundo (en escala logarítmica, ya que la distribución tiene
+        # una cola larga): detecta partidas con puntuación imposible para su duración
+        frame["rate"] = np.log1p(frame["score"].clip(lower=0) / frame["time_played"].clip(lower=1))
+        score_z = _robust_zscores(frame, "score")
+        rate_z = _robust_zscores(frame, "rate")
+
+        reasons = np.select(
+            [frame["time_played"].to_numpy() <= 0, rate_z.to_numpy() > OUTLIER_THRESHOLD, score_z.to_numpy() > OUTLIER_THRESHOLD],
+            ["time_played", "score_rate", "score"],
+            default=""
+        )
+        severity = np.maximum(score_z.to_numpy(), rate_z.to_numpy())
+        suspicious = np.flatnonzero(reasons != "")
+        suspicious = suspicious[np.argsort(-severity[suspicious])][:MAX_FLAGGED]
+        flagged = [
+            {
+                "id": frame["id"].iat[idx],
+                "score": int(frame["score"].iat[idx]),
+                "level": int(frame["level"].iat[idx]),
+                "time_played": int(frame["time_played"].iat[idx]),
+                "reason": str(reasons[idx]),
+                "zscore": round(float(severity[idx]), 2),
+            }
+            for idx in suspicious
+        ]
+
+    return {
+        "computed_at": datetime.utcnow(),
+        "total_games": total_games,
+        "score_percentiles": _percentiles(scores),
+        "time_played_percentiles": _percentiles(frame["time_played"].to_numpy()),
+        "histogram_edges": [round(float(edge), 2) for edge in edges],
+        "histogram": histogram.tolist(),
+        "levels": levels,
+        "flagged_scores": flagged,
+    }
+
+
+async def refresh_stats(database) -> dict:
+    """Recalcular las estadísticas y guardarlas en `score_stats`"""
+    columns = await load_score_columns(database)
+    # El cálculo es CPU puro: se ejecuta en un hilo para no bloquear el event loop
+    stats = await asyncio.to_thread(compute_stats, columns)
+
+    # Completar las puntuaciones marcadas con el nombre del jugador, buscándolo
+    # primero en `scores` y después en el archivo
+    names = {}
+    flagged_ids = [ObjectId(entry["id"]) for entry in stats["flagged_scores"] if ObjectId.is_valid(entry["id"])]
+    if flagged_ids:
+        documents = await database.scores.find({"_id": {"$in": flagged_ids}}).to_list(None)
+        names = {score.id: score.player_name for score in await score_store.to_scores(database, documents)}
+    archived_ids = [entry["id"] for entry in stats["flagged_scores"] if entry["id"] not in names]
+    if archived_ids:
+        async for frame in archive.iter_archived_frames(database, columns=["id", "player_name"], ids=archived_ids):
+            names.update(zip(frame["id"], frame["player_name"]))
+    for entry in stats["flagged_scores"]:
+        entry["player_name"] = names.get(entry["id"])
+
+    await database[STATS_COLLECTION].replace_one({"_id": STATS_DOCUMENT_ID}, stats, upsert=True)
+    return stats
+
+
+async def get_stats(database):
+    """Obtener las últimas estadísticas calculadas (o None si no existen)"""
+    return await database[STATS_COLLECTION].find_one({"_id": STATS_DOCUMENT_ID}, {"_id": 0})
+
+
+if __name__ == "__main__":
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        database = client[os.environ['DB_NAME']]
+        stats = await refresh_stats(database)
+        print(f"Estadísticas calculadas sobre {stats['total_games']} puntuaciones "
+              f"({len(stats['flagged_scores'])} marcadas como sospechosas)")
+        client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,210 @@
+"""
+Ingesta de telemetría de partidas (kills, muertes, fps, ...).
+
+Los clientes agrupan eventos en frames MessagePack y los envían comprimidos
+(gzip o deflate) a `POST /api/telemetry`. Cada frame tiene la forma:
+
+    {"s": id_de_sesión, "sc": escena, "t0": epoch_ms, "e": [[dt_ms, tipo, valor], ...]}
+
+donde `dt_ms` es el desfase respecto a `t0`. Un cuerpo puede contener varios
+frames concatenados. Los eventos se encolan y una tarea en segundo plano los
+escribe por lotes en la colección de series temporales `telemetry`, empezando
+solo cuando el precalentamiento la ha creado. Si ya existe una colección
+`telemetry` normal, el precalentamiento falla hasta que se borre. Si la cola
+está llena, el endpoint responde 429 para que el cliente reintente más tarde.
+"""
+
+import asyncio
+import logging
+import math
+import zlib
+from datetime import datetime, timedelta
+from typing import List
+import msgpack
+from fastapi import APIRouter, HTTPException, Request
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+TELEMETRY_COLLECTION = "telemetry"
+TELEMETRY_TTL = timedelta(days=7)
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_DECOMPRESSED_BYTES = 8 * 1024 * 1024
+
+# Eventos pendientes de escribir a partir de los cuales se rechazan peticiones
+MAX_PENDING_EVENTS = 200000
+BATCH_SIZE = 5000
+FLUSH_INTERVAL = 0.5  # segundos
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class InvalidFrame(ValueError):
+    """El cuerpo no contiene frames de telemetría válidos"""
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    """Descomprimir el cuerpo limitando el tamaño resultante"""
+    if encoding in ("", "identity"):
+        return body
+    if encoding not in ("gzip", "deflate"):
+        raise InvalidFrame(f"Content-Encoding no soportado: {encoding}")
+
+    # wbits=47 detecta automáticamente cabeceras gzip y zlib
+    decompressor = zlib.decompressobj(wbits=47)
+    try:
+        data = decompressor.decompress(body, MAX_DECOMPRESSED_BYTES)
+    except zlib.error as e:
+        raise InvalidFrame(f"Cuerpo comprimido no válido: {e}")
+    if decompressor.unconsumed_tail:
+        raise InvalidFrame("Telemetría descomprimida demasiado grande")
+    return data
+
+
+def decode_frames(data: bytes) -> List[dict]:
+    """Convertir los frames MessagePack del cuerpo en documentos de MongoDB"""
+    unpacker = msgpack.Unpacker(use_list=False, raw=False, max_buffer_size=len(data) or 1)
+    unpacker.feed(data)
+
+    documents = []
+    consumed = 0
+    try:
+        for frame in unpacker:
+            consumed = unpacker.tell()
+            session, scene, t0, events = frame["s"], frame["sc"], frame["t0"], frame["e"]
+            if not isinstance(session, str) or not isinstance(scene, str) or not isinstance(t0, int):
+                raise InvalidFrame("Cabecera de frame no válida")
+            base = _EPOCH + timedelta(milliseconds=t0)
+            for dt, kind, value in events:
+                if not isinstance(kind, str) or not isinstance(value, (int, float)) or isinstance(value, bool):
+                    raise InvalidFrame("Evento de telemetría no válido")
+                if not math.isfinite(value):
+                    raise InvalidFrame("Valor de telemetría no finito")
+                documents.append({
+                    "ts": base + timedelta(milliseconds=dt),
+                    "m": {"s": session, "sc": scene, "k": kind},
+                    "v": value,
+                })
+        if consumed != len(data):
+            raise InvalidFrame("Frame de telemetría incompleto")
+    except (KeyError, TypeError, ValueError, OverflowError, msgpack.UnpackException) as e:
+        if isinstance(e, InvalidFrame):
+            raise
+        raise InvalidFrame(f"Frame de telemetría no válido: {e}")
+    return documents
+
+
+class TelemetryWriter:
+    """Cola acotada de eventos que se escriben en MongoDB por lotes"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending = 0
+        self.task = None
+        # Se activa cuando existe la colección de series temporales; hasta
+        # entonces un insert_many crearía una colección normal
+        self.collection_ready = asyncio.Event()
+
+    def submit(self, documents: List[dict]) -> bool:
+        """Encolar eventos; retorna False si la cola está llena"""
+        if self.pending + len(documents) > MAX_PENDING_EVENTS:
+            return False
+        self.pending += len(documents)
+        self.queue.put_nowait(documents)
+        return True
+
+    def start(self, database):
+        self.task = asyncio.create_task(self._run(database))
+
+    async def stop(self):
+        """Detener la tarea escribiendo antes los eventos pendientes"""
+        if self.task:
+            if not self.collection_ready.is_set():
+                # Sin colección (MongoDB no disponible) no hay dónde escribirlos
+                self.task.cancel()
+                return
+            await self.queue.put(None)
+            await self.task
+
+    async def _run(self, database):
+        collection = database[TELEMETRY_COLLECTION]
+        await self.collection_ready.wait()
+        stopping = False
+        while not stopping:
+            batch = []
+            documents = await self.queue.get()
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + FLUSH_INTERVAL
+            # Acumular hasta llenar el lote o agotar el intervalo de escritura
+            while documents is not None:
+                batch.extend(documents)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    documents = await asyncio.wait_for(self.queue.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+            stopping = documents is None
+
+            if batch:
+                try:
+                    await collection.insert_many(batch, ordered=False)
+                except Exception as e:
+                    logger.warning(f"No se pudieron escribir {len(batch)} eventos de telemetría: {e}")
+                self.pending -= len(batch)
+
+
+# Instancia compartida por el endpoint y el ciclo de vida del servidor
+writer = TelemetryWriter()
+
+
+async def ensure_telemetry_collection(database):
+    """Crear la colección de series temporales si todavía no existe"""
+    try:
+        await database.create_collection(
+            TELEMETRY_COLLECTION,
+            timeseries={"timeField": "ts", "metaField": "m", "granularity": "seconds"},
+            expireAfterSeconds=int(TELEMETRY_TTL.total_seconds())
+        )
+    except CollectionInvalid:
+        # Ya existe: comprobar que no sea una colección normal creada antes.
+        # El precalentamiento falla (y el worker no pasa a ready) hasta que se borre
+        cursor = await database.list_collections(filter={"name": TELEMETRY_COLLECTION})
+        collections = await cursor.to_list(1)
+        if collections and collections[0].get("type") != "timeseries":
+            raise RuntimeError(
+                f"La colección '{TELEMETRY_COLLECTION}' existe pero no es de series temporales; "
+                f"hay que borrarla para que se vuelva a crear"
+            )
+    writer.collection_ready.set()
+
+
+@router.post("/telemetry", status_code=202)
+async def ingest_telemetry(request: Request):
+    """Recibir frames de telemetría MessagePack comprimidos"""
+    content_length = request.headers.get("content-length")
+    if content_length is not None and not content_length.isdigit():
+        raise HTTPException(status_code=400, detail="Content-Length no válido")
+    if int(content_length or 0) > MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Lote de telemetría demasiado grande")
+
+    # Sin Content-Length (chunked) se corta la lectura al superar el límite
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Lote de telemetría demasiado grande")
+    body = bytes(body)
+
+    try:
+        data = decompress(body, request.headers.get("content-encoding", "").lower())
+        documents = decode_frames(data)
+    except InvalidFrame as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not writer.submit(documents):
+        raise HTTPException(status_code=429, detail="Cola de telemetría llena", headers={"Retry-After": "1"})
+    return {"accepted": len(documents)}
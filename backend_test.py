@@ -7,7 +7,9 @@ Tests all endpoints with realistic data and validates responses
 import requests
 import json
 import sys
+import subprocess
 from datetime import datetime
+from pathlib import Path
 import time
 
 # Get the backend URL from frontend environment
@@ -65,6 +67,23 @@ def test_health_check():
         log_test("Health Check", False, f"Request failed: {str(e)}")
     return False
 
+def test_liveness_and_readiness():
+    """Test GET /api/health/live and /api/health/ready - Deployment probes"""
+    try:
+        live = requests.get(f"{API_URL}/health/live", timeout=10)
+        ready = requests.get(f"{API_URL}/health/ready", timeout=10)
+        if live.status_code == 200 and ready.status_code == 200:
+            timings = ready.json().get("warm_up_ms", {})
+            log_test("Liveness & Readiness", True, f"Worker ready, warm-up steps: {list(timings)}")
+            return True
+        elif live.status_code != 200:
+            log_test("Liveness & Readiness", False, f"Liveness returned {live.status_code}", live)
+        else:
+            log_test("Liveness & Readiness", False, f"Readiness returned {ready.status_code}", ready)
+    except Exception as e:
+        log_test("Liveness & Readiness", False, f"Request failed: {str(e)}")
+    return False
+
 def test_get_all_demos():
     """Test GET /api/demos - Get all demos"""
     try:
@@ -118,6 +137,27 @@ def test_filter_demos_by_level():
     
     return all_passed
 
+def test_get_demo_summaries():
+    """Test GET /api/demos?fields=summary - Lightweight list projection"""
+    try:
+        response = requests.get(f"{API_URL}/demos?fields=summary", timeout=10)
+        if response.status_code == 200:
+            demos = response.json()
+            if isinstance(demos, list) and len(demos) > 0:
+                expected_fields = {"id", "title", "level", "difficulty", "preview", "scene_name"}
+                if all(set(demo) == expected_fields for demo in demos):
+                    log_test("Get Demo Summaries", True, f"Retrieved {len(demos)} summaries without code_example")
+                    return True
+                else:
+                    log_test("Get Demo Summaries", False, f"Unexpected fields: {sorted(demos[0])}", response)
+            else:
+                log_test("Get Demo Summaries", False, "No demos returned or invalid format", response)
+        else:
+            log_test("Get Demo Summaries", False, f"Unexpected status code: {response.status_code}", response)
+    except Exception as e:
+        log_test("Get Demo Summaries", False, f"Request failed: {str(e)}")
+    return False
+
 def test_get_specific_demo(demos):
     """Test GET /api/demos/{demo_id} - Get specific demo"""
     if not demos:
@@ -154,6 +194,27 @@ def test_get_nonexistent_demo():
         log_test("Get Non-existent Demo", False, f"Request failed: {str(e)}")
     return False
 
+def test_search_demos():
+    """Test GET /api/demos/search - Full-text search with technology facets"""
+    try:
+        response = requests.get(f"{API_URL}/demos/search", params={"q": "fisicas"}, timeout=10)
+        if response.status_code == 200:
+            data = response.json()
+            if all(field in data for field in ["total", "results", "facets"]):
+                # Accent-insensitive: "fisicas" must match "Físicas Avanzadas"
+                if any(demo["title"] == "Físicas Avanzadas" for demo in data["results"]):
+                    log_test("Search Demos", True, f"Found {data['total']} demos, facets: {list(data['facets'])}")
+                    return True
+                else:
+                    log_test("Search Demos", False, "Accent-insensitive match not found", response)
+            else:
+                log_test("Search Demos", False, "Missing fields in search response", response)
+        else:
+            log_test("Search Demos", False, f"Unexpected status code: {response.status_code}", response)
+    except Exception as e:
+        log_test("Search Demos", False, f"Request failed: {str(e)}")
+    return False
+
 def test_save_score():
     """Test POST /api/scores - Save game score"""
     score_data = {
@@ -185,6 +246,32 @@ def test_save_score():
         log_test("Save Score", False, f"Request failed: {str(e)}")
     return None
 
+def test_save_score_idempotent():
+    """Test POST /api/scores with Idempotency-Key - Retries must not duplicate"""
+    score_data = {
+        "player_name": "RetryPilot",
+        "score": 1200,
+        "level": 2,
+        "lives_remaining": 1,
+        "time_played": 95
+    }
+    headers = {"Idempotency-Key": f"backend-test-{time.time()}"}
+    
+    try:
+        first = requests.post(f"{API_URL}/scores", json=score_data, headers=headers, timeout=10)
+        retry = requests.post(f"{API_URL}/scores", json=score_data, headers=headers, timeout=10)
+        if first.status_code == 200 and retry.status_code == 200:
+            if first.json()["id"] == retry.json()["id"]:
+                log_test("Idempotent Save Score", True, f"Retry returned original score {first.json()['id']}")
+                return True
+            else:
+                log_test("Idempotent Save Score", False, "Retry created a different score", retry)
+        else:
+            log_test("Idempotent Save Score", False, f"Unexpected status codes: {first.status_code}, {retry.status_code}", retry)
+    except Exception as e:
+        log_test("Idempotent Save Score", False, f"Request failed: {str(e)}")
+    return False
+
 def test_save_multiple_scores():
     """Test saving multiple scores for leaderboard testing"""
     test_scores = [
@@ -207,6 +294,29 @@ def test_save_multiple_scores():
     log_test("Save Multiple Scores", saved_count > 0, f"Saved {saved_count}/{len(test_scores)} additional scores")
     return saved_count > 0
 
+def test_get_recent_scores():
+    """Test GET /api/scores/recent - Latest games ticker with since cursor"""
+    try:
+        response = requests.get(f"{API_URL}/scores/recent?limit=5", timeout=10)
+        if response.status_code == 200:
+            data = response.json()
+            if "cursor" in data and isinstance(data.get("scores"), list) and len(data["scores"]) <= 5:
+                # Polling with the returned cursor must not repeat already seen scores
+                follow_up = requests.get(f"{API_URL}/scores/recent", params={"since": data["cursor"]}, timeout=10)
+                seen = {score["id"] for score in data["scores"]}
+                if follow_up.status_code == 200 and not seen & {score["id"] for score in follow_up.json()["scores"]}:
+                    log_test("Get Recent Scores", True, f"Retrieved {len(data['scores'])} recent scores, cursor {data['cursor']}")
+                    return True
+                else:
+                    log_test("Get Recent Scores", False, "Cursor returned already seen scores", follow_up)
+            else:
+                log_test("Get Recent Scores", False, "Invalid response format or limit ignored", response)
+        else:
+            log_test("Get Recent Scores", False, f"Unexpected status code: {response.status_code}", response)
+    except Exception as e:
+        log_test("Get Recent Scores", False, f"Request failed: {str(e)}")
+    return False
+
 def test_get_leaderboard():
     """Test GET /api/scores/leaderboard - Get leaderboard"""
     try:
@@ -258,6 +368,23 @@ def test_get_leaderboard_with_limit():
         log_test("Get Limited Leaderboard", False, f"Request failed: {str(e)}")
     return False
 
+def test_get_archived_scores():
+    """Test GET /api/scores/archive - Read scores from the on-disk archive"""
+    try:
+        response = requests.get(f"{API_URL}/scores/archive", params={"since": "2020-01-01T00:00:00", "limit": 5}, timeout=30)
+        if response.status_code == 200:
+            scores = response.json()
+            if isinstance(scores, list) and len(scores) <= 5:
+                log_test("Get Archived Scores", True, f"Retrieved {len(scores)} archived scores")
+                return True
+            else:
+                log_test("Get Archived Scores", False, "Invalid response format or limit ignored", response)
+        else:
+            log_test("Get Archived Scores", False, f"Unexpected status code: {response.status_code}", response)
+    except Exception as e:
+        log_test("Get Archived Scores", False, f"Request failed: {str(e)}")
+    return False
+
 def test_get_game_stats():
     """Test GET /api/stats - Get game statistics"""
     try:
@@ -285,6 +412,113 @@ def test_get_game_stats():
         log_test("Get Game Stats", False, f"Request failed: {str(e)}")
     return False
 
+def test_get_score_distribution():
+    """Test GET /api/stats/distribution - Precomputed percentiles and histograms"""
+    try:
+        # Compute the distribution over the scores saved by the previous tests
+        # with the offline batch job (it is not exposed through the API)
+        backend_dir = Path(__file__).parent / "backend"
+        job = subprocess.run([sys.executable, "stats_engine.py"], cwd=backend_dir, capture_output=True, text=True, timeout=120)
+        if job.returncode != 0:
+            log_test("Get Score Distribution", False, f"stats_engine.py failed: {job.stderr.strip()[-300:]}")
+            return False
+
+        response = requests.get(f"{API_URL}/stats/distribution", timeout=10)
+        if response.status_code == 200:
+            stats = response.json()
+            required_fields = ["total_games", "score_percentiles", "histogram_edges", "histogram", "levels", "flagged_scores"]
+            if not all(field in stats for field in required_fields):
+                missing = [f for f in required_fields if f not in stats]
+                log_test("Get Score Distribution", False, f"Missing fields in distribution: {missing}", response)
+            elif stats["total_games"] == 0 or not stats["levels"]:
+                log_test("Get Score Distribution", False, "Distribution is empty after saving scores", response)
+            elif len(stats["histogram_edges"]) != len(stats["histogram"]) + 1:
+                log_test("Get Score Distribution", False, "Histogram edges do not match histogram bins", response)
+            elif sum(stats["histogram"]) != stats["total_games"]:
+                log_test("Get Score Distribution", False, "Histogram counts do not add up to total games", response)
+            elif sum(level["games"] for level in stats["levels"]) != stats["total_games"]:
+                log_test("Get Score Distribution", False, "Per-level games do not add up to total games", response)
+            elif any(len(level["histogram"]) != len(stats["histogram"]) for level in stats["levels"]):
+                log_test("Get Score Distribution", False, "Per-level histograms do not match global bins", response)
+            else:
+                log_test("Get Score Distribution", True, f"Distribution over {stats['total_games']} games in {len(stats['levels'])} levels, p50: {stats['score_percentiles'].get('p50')}")
+                return True
+        else:
+            log_test("Get Score Distribution", False, f"Unexpected status code: {response.status_code}", response)
+    except Exception as e:
+        log_test("Get Score Distribution", False, f"Request failed: {str(e)}")
+    return False
+
+def test_get_score_timeseries():
+    """Test GET /api/analytics/timeseries - Games per hour from rollups"""
+    try:
+        response = requests.get(f"{API_URL}/analytics/timeseries?granularity=hour", timeout=10)
+        if response.status_code == 200:
+            points = response.json()
+            if isinstance(points, list) and len(points) > 0:
+                required_fields = ["bucket", "games", "average_score", "max_score", "average_time_played"]
+                if all(field in points[-1] for field in required_fields):
+                    log_test("Get Score Timeseries", True, f"Retrieved {len(points)} hourly buckets, last: {points[-1]['games']} games")
+                    return True
+                else:
+                    missing = [f for f in required_fields if f not in points[-1]]
+                    log_test("Get Score Timeseries", False, f"Missing fields in rollup point: {missing}", response)
+            else:
+                log_test("Get Score Timeseries", False, "No rollups returned after saving scores", response)
+        else:
+            log_test("Get Score Timeseries", False, f"Unexpected status code: {response.status_code}", response)
+    except Exception as e:
+        log_test("Get Score Timeseries", False, f"Request failed: {str(e)}")
+    return False
+
+def test_get_session_lengths():
+    """Test GET /api/analytics/session-lengths - Session length distribution"""
+    try:
+        response = requests.get(f"{API_URL}/analytics/session-lengths", timeout=10)
+        if response.status_code == 200:
+            buckets = response.json()
+            if isinstance(buckets, list) and sum(bucket["games"] for bucket in buckets) > 0:
+                log_test("Get Session Lengths", True, f"Retrieved {len(buckets)} session length buckets")
+                return True
+            else:
+                log_test("Get Session Lengths", False, "Empty session length distribution", response)
+        else:
+            log_test("Get Session Lengths", False, f"Unexpected status code: {response.status_code}", response)
+    except Exception as e:
+        log_test("Get Session Lengths", False, f"Request failed: {str(e)}")
+    return False
+
+def test_ingest_telemetry():
+    """Test POST /api/telemetry - Batched gzip-compressed MessagePack frames"""
+    try:
+        import gzip
+        import msgpack
+    except ImportError:
+        log_test("Ingest Telemetry", False, "msgpack is not installed in the test environment")
+        return False
+    
+    frame = {
+        "s": f"backend-test-{time.time()}",
+        "sc": "SpaceShooterScene",
+        "t0": int(time.time() * 1000),
+        "e": [[i * 16, "fps", 60.0] for i in range(100)] + [[800, "kill", 1], [1200, "death", 1]]
+    }
+    try:
+        response = requests.post(
+            f"{API_URL}/telemetry",
+            data=gzip.compress(msgpack.packb(frame)),
+            headers={"Content-Type": "application/msgpack", "Content-Encoding": "gzip"},
+            timeout=10
+        )
+        if response.status_code == 202 and response.json().get("accepted") == len(frame["e"]):
+            log_test("Ingest Telemetry", True, f"Accepted {response.json()['accepted']} telemetry events")
+            return True
+        else:
+            log_test("Ingest Telemetry", False, f"Unexpected response: {response.status_code}", response)
+    except Exception as e:
+        log_test("Ingest Telemetry", False, f"Request failed: {str(e)}")
+    return False
+
 def test_create_demo():
     """Test POST /api/demos - Create new demo (admin)"""
     demo_data = {
@@ -354,33 +588,61 @@ def run_all_tests():
         print("❌ Health check failed - API may not be running")
         return False
     
+    # Test 1b: Liveness and readiness probes
+    test_liveness_and_readiness()
+    
     # Test 2: Get all demos
     demos = test_get_all_demos()
     
     # Test 3: Filter demos by level
     test_filter_demos_by_level()
     
+    # Test 3b: Get demo summaries
+    test_get_demo_summaries()
+    
     # Test 4: Get specific demo
     test_get_specific_demo(demos)
     
     # Test 5: Get non-existent demo
     test_get_nonexistent_demo()
     
+    # Test 5b: Search demos
+    test_search_demos()
+    
     # Test 6: Save score
     test_save_score()
     
+    # Test 6b: Idempotent score retries
+    test_save_score_idempotent()
+    
     # Test 7: Save multiple scores for leaderboard testing
     test_save_multiple_scores()
     
+    # Test 7b: Recent scores ticker
+    test_get_recent_scores()
+    
     # Test 8: Get leaderboard
     test_get_leaderboard()
     
     # Test 9: Get limited leaderboard
     test_get_leaderboard_with_limit()
     
+    # Test 9b: Read score archive
+    test_get_archived_scores()
+    
     # Test 10: Get game stats
     test_get_game_stats()
     
+    # Test 10a: Precomputed score distribution
+    test_get_score_distribution()
+    
+    # Test 10b: Analytics rollups
+    test_get_score_timeseries()
+    test_get_session_lengths()
+    
+    # Test 10c: Gameplay telemetry ingestion
+    test_ingest_telemetry()
+    
     # Test 11: Create demo (admin)
     created_demo = test_create_demo()
     